@@ -1,8 +1,165 @@
+import datetime
+
 from django.contrib import admin
-from django.utils.translation import ugettext_lazy as _
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.shortcuts import render_to_response
+from django.template import RequestContext
+from django.utils.translation import ugettext_lazy as _, ungettext
+from taggit.models import Tag, TaggedItem
 
-from flatpages_plus.forms import FlatpageForm
+from flatpages_plus import app_settings
+from flatpages_plus.caching import bump_generation
+from flatpages_plus.forms import FlatpageForm, ReassignOwnerForm, RetagForm
+from flatpages_plus.lookup import clear_lookup_cache
 from flatpages_plus.models import FlatPage
+from flatpages_plus.purging import purge, purge_pages, purging_enabled, \
+    tag_key
+from flatpages_plus.related import chunks, queue_related
+from flatpages_plus.search import matching_page_ids
+from flatpages_plus.utils import bulk_insert
+
+
+class FlatPageChangeList(ChangeList):
+    """
+    Searches by URL prefix when the query starts with a slash, and through 
+    the search index otherwise, so neither needs a ``LIKE '%...%'`` scan of 
+    every page.
+    
+    The search index only matches whole words, so if it finds nothing the 
+    search falls back to matching part of the URL, title or link name.
+    """
+    
+    def get_query_set(self, *args, **kwargs):
+        search_fields, self.search_fields = self.search_fields, ()
+        try:
+            qs = super(FlatPageChangeList, self).get_query_set(*args, **kwargs)
+        finally:
+            self.search_fields = search_fields
+        query = self.query.strip()
+        if query.startswith('/'):
+            qs = qs.filter(url__startswith=query)
+        elif query:
+            page_ids = matching_page_ids(query)
+            indexed = page_ids is not None and qs.filter(pk__in=page_ids)
+            if indexed and indexed.exists():
+                qs = indexed
+            else:
+                qs = qs.filter(Q(url__icontains=query) | 
+                    Q(title__icontains=query) | Q(name__icontains=query))
+        return qs
+
+
+def pages_changed(page_ids):
+    """
+    ``update()`` doesn't send signals, so invalidate the caches ourselves.
+    """
+    bump_generation()
+    clear_lookup_cache()
+    purge_pages(page_ids)
+
+def action_form(modeladmin, request, queryset, form, title):
+    """
+    Render the intermediate page asking for the details of a bulk action.
+    """
+    opts = modeladmin.model._meta
+    return render_to_response('admin/flatpages_plus/flatpage/action_form.html', {
+        'title': title,
+        'form': form,
+        'queryset': queryset,
+        'count': queryset.count(),
+        'opts': opts,
+        'app_label': opts.app_label,
+        'action': request.POST.get('action'),
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        'select_across': request.POST.get('select_across'),
+        'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+    }, context_instance=RequestContext(request))
+
+def set_status(modeladmin, request, queryset, status):
+    page_ids = list(queryset.values_list('pk', flat=True))
+    count = queryset.update(status=status, modified=datetime.datetime.now())
+    pages_changed(page_ids)
+    modeladmin.message_user(request, ungettext('%(count)d page was updated.',
+        '%(count)d pages were updated.', count) % {'count': count})
+
+def publish(modeladmin, request, queryset):
+    set_status(modeladmin, request, queryset, 'p')
+publish.short_description = _('Publish selected pages')
+
+def unpublish(modeladmin, request, queryset):
+    set_status(modeladmin, request, queryset, 'd')
+unpublish.short_description = _('Unpublish selected pages')
+
+def reassign_owner(modeladmin, request, queryset):
+    form = None
+    if 'apply' in request.POST:
+        form = ReassignOwnerForm(request.POST)
+        if form.is_valid():
+            page_ids = list(queryset.values_list('pk', flat=True))
+            count = queryset.update(owner=form.cleaned_data['owner'], 
+                                    modified=datetime.datetime.now())
+            pages_changed(page_ids)
+            modeladmin.message_user(request, ungettext(
+                '%(count)d page was reassigned.', 
+                '%(count)d pages were reassigned.', count) % {'count': count})
+            return None
+    if form is None:
+        form = ReassignOwnerForm()
+    return action_form(modeladmin, request, queryset, form, 
+                       _('Reassign owner'))
+reassign_owner.short_description = _('Reassign owner of selected pages')
+
+@transaction.commit_on_success
+def retag_pages(page_ids, names, mode):
+    """
+    Add or remove tags on many pages with a handful of queries, rather than 
+    saving each page's tags one at a time.
+    """
+    content_type = ContentType.objects.get_for_model(FlatPage)
+    tags = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+    if mode == RetagForm.ADD:
+        for name in names:
+            if name not in tags:
+                tags[name] = Tag.objects.create(name=name).pk
+    for ids in chunks(page_ids):
+        items = TaggedItem.objects.filter(content_type=content_type, 
+            object_id__in=ids, tag__in=tags.values())
+        if mode == RetagForm.ADD:
+            existing = set(items.values_list('object_id', 'tag'))
+            bulk_insert(TaggedItem, [TaggedItem(content_type=content_type,
+                object_id=page_id, tag_id=tag_id) for page_id in ids 
+                for tag_id in tags.values() 
+                if (page_id, tag_id) not in existing])
+        else:
+            items.delete()
+    pages_changed(page_ids)
+    if purging_enabled():
+        purge([tag_key(slug) for slug in Tag.objects.filter(
+            pk__in=tags.values()).values_list('slug', flat=True)])
+    if app_settings.RELATED_PAGES:
+        queue_related(page_ids, tags.values())
+
+def retag(modeladmin, request, queryset):
+    form = None
+    if 'apply' in request.POST:
+        form = RetagForm(request.POST)
+        if form.is_valid():
+            page_ids = list(queryset.values_list('pk', flat=True))
+            retag_pages(page_ids, form.cleaned_data['tags'], 
+                        form.cleaned_data['mode'])
+            modeladmin.message_user(request, ungettext(
+                '%(count)d page was retagged.', 
+                '%(count)d pages were retagged.', len(page_ids)) % {
+                'count': len(page_ids)})
+            return None
+    if form is None:
+        form = RetagForm()
+    return action_form(modeladmin, request, queryset, form, _('Retag pages'))
+retag.short_description = _('Add or remove tags on selected pages')
 
 
 class FlatPageAdmin(admin.ModelAdmin):
@@ -30,6 +187,19 @@ class FlatPageAdmin(admin.ModelAdmin):
     )
     list_display = ('url', 'title', 'name', 'status', 'owner', 'views', 'modified', 'created')
     list_filter = ('status', 'sites', 'enable_comments', 'registration_required',)
-    search_fields = ('url', 'title', 'name', 'owner',)
+    list_select_related = True
+    # Searches are handled by FlatPageChangeList; this just turns the search
+    # box on.
+    search_fields = ('^url',)
+    actions = [publish, unpublish, reassign_owner, retag]
+    
+    def queryset(self, request):
+        qs = FlatPage.objects.get_estimated_count_query_set()
+        if self.ordering:
+            qs = qs.order_by(*self.ordering)
+        return qs
+    
+    def get_changelist(self, request, **kwargs):
+        return FlatPageChangeList
 
 admin.site.register(FlatPage, FlatPageAdmin)
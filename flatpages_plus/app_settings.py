@@ -0,0 +1,129 @@
+from django.conf import settings
+
+
+# How page views are counted. One of 'sync' (an UPDATE per view), 'buffered'
+# (accumulated in-process and flushed periodically), 'cache' (accumulated in
+# the cache and flushed by `manage.py flush_flatpage_views`), 'disabled', or
+# the dotted path to a custom view counter class.
+VIEW_COUNTER = getattr(settings, 'FLATPAGES_PLUS_VIEW_COUNTER', 'sync')
+
+# The buffered counter flushes once this many seconds have passed since the
+# last flush, or once this many views have been buffered, whichever is first.
+VIEW_COUNTER_FLUSH_INTERVAL = getattr(settings,
+    'FLATPAGES_PLUS_VIEW_COUNTER_FLUSH_INTERVAL', 30)
+VIEW_COUNTER_FLUSH_THRESHOLD = getattr(settings,
+    'FLATPAGES_PLUS_VIEW_COUNTER_FLUSH_THRESHOLD', 1000)
+
+# How long (in seconds) derived data such as breadcrumbs is kept in the 
+# cache. Cached data is also invalidated whenever a flatpage changes.
+CACHE_TIMEOUT = getattr(settings, 'FLATPAGES_PLUS_CACHE_TIMEOUT', 60 * 60)
+
+# Where flatpages looked up by URL are cached: 'django' (the default cache),
+# 'lru' (a bounded in-process cache) or None to always hit the database.
+LOOKUP_CACHE = getattr(settings, 'FLATPAGES_PLUS_LOOKUP_CACHE', 'django')
+LOOKUP_CACHE_SIZE = getattr(settings, 'FLATPAGES_PLUS_LOOKUP_CACHE_SIZE', 1000)
+
+# Whether FlatpageFallbackMiddleware keeps an in-memory filter of flatpage 
+# URLs, so 404s that can't be flatpages don't hit the database, and the 
+# false positive rate the filter is sized for.
+URL_FILTER = getattr(settings, 'FLATPAGES_PLUS_URL_FILTER', True)
+URL_FILTER_ERROR_RATE = getattr(settings, 'FLATPAGES_PLUS_URL_FILTER_ERROR_RATE', 0.01)
+
+# How long, in seconds, each process keeps its URL filter before rebuilding 
+# it, even if no flatpage has changed.
+URL_FILTER_TIMEOUT = getattr(settings, 'FLATPAGES_PLUS_URL_FILTER_TIMEOUT', 300)
+
+# Change this whenever the flatpage templates change, so browsers and caches 
+# don't keep using pages rendered with the old templates.
+TEMPLATE_VERSION = getattr(settings, 'FLATPAGES_PLUS_TEMPLATE_VERSION', '')
+
+# Whether pages rendered for anonymous users are cached, and for how long.
+RESPONSE_CACHE = getattr(settings, 'FLATPAGES_PLUS_RESPONSE_CACHE', False)
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'FLATPAGES_PLUS_RESPONSE_CACHE_TIMEOUT', 
+    CACHE_TIMEOUT)
+
+# The longest (in seconds) that {% get_flatpages ... cache=n %} keeps random
+# results, so they still change from time to time.
+RANDOM_CACHE_TIMEOUT = getattr(settings, 'FLATPAGES_PLUS_RANDOM_CACHE_TIMEOUT', 10)
+
+# Whether the flatpage view keeps its own cache of loaded templates (it is 
+# always bypassed when DEBUG is on), and whether it checks the modification
+# times of the template files (and the ones they extend or include) so 
+# edited templates are reloaded.
+TEMPLATE_CACHE = getattr(settings, 'FLATPAGES_PLUS_TEMPLATE_CACHE', True)
+TEMPLATE_CACHE_CHECK_MTIME = getattr(settings, 
+    'FLATPAGES_PLUS_TEMPLATE_CACHE_CHECK_MTIME', True)
+
+# Whether tag filters in get_flatpages() are answered from an in-memory index
+# of the pages with each tag, and the most page IDs it will pass to the 
+# database in one query (SQLite allows at most 999 parameters) before falling
+# back to joining against the tag tables.
+TAG_INDEX = getattr(settings, 'FLATPAGES_PLUS_TAG_INDEX', True)
+TAG_INDEX_MAX_IDS = getattr(settings, 'FLATPAGES_PLUS_TAG_INDEX_MAX_IDS', 500)
+
+# Whether the flatpage view and middleware time each phase of a request and
+# send the ``flatpage_timings`` signal, and whether they also add the timings
+# to the response in a Server-Timing header.
+INSTRUMENTATION = getattr(settings, 'FLATPAGES_PLUS_INSTRUMENTATION', False)
+SERVER_TIMING = getattr(settings, 'FLATPAGES_PLUS_SERVER_TIMING', False)
+
+# How much more a word counts towards a page's search ranking when it's in 
+# the page's title or link name than when it's in the content.
+SEARCH_TITLE_WEIGHT = getattr(settings, 'FLATPAGES_PLUS_SEARCH_TITLE_WEIGHT', 5)
+SEARCH_NAME_WEIGHT = getattr(settings, 'FLATPAGES_PLUS_SEARCH_NAME_WEIGHT', 3)
+
+# Whether the related pages of each page are kept up to date as pages are
+# tagged and untagged, and how many related pages are stored for each page.
+RELATED_PAGES = getattr(settings, 'FLATPAGES_PLUS_RELATED_PAGES', True)
+RELATED_PAGES_LIMIT = getattr(settings, 'FLATPAGES_PLUS_RELATED_PAGES_LIMIT', 10)
+# Tags on more pages than this are too common to make two pages related, 
+# and rescoring every page that has them would take too long. They still 
+# count towards each page's number of tags. None counts every tag.
+RELATED_PAGES_MAX_TAG_PAGES = getattr(settings, 
+    'FLATPAGES_PLUS_RELATED_PAGES_MAX_TAG_PAGES', 1000)
+
+# How many flatpage IDs each part of the sitemap covers (a part can't list 
+# more than 50,000 URLs).
+SITEMAP_SHARD_SIZE = getattr(settings, 'FLATPAGES_PLUS_SITEMAP_SHARD_SIZE', 10000)
+
+# The admin shows the database's estimate of the number of flatpages, rather
+# than counting them, when there are more than this many (PostgreSQL and 
+# MySQL only).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = getattr(settings, 
+    'FLATPAGES_PLUS_ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+
+# The functions, as dotted paths, that process a page's content when it's 
+# saved, in order. See flatpages_plus/processors.py.
+CONTENT_PROCESSORS = getattr(settings, 'FLATPAGES_PLUS_CONTENT_PROCESSORS', (
+    'flatpages_plus.processors.heading_anchors',
+    'flatpages_plus.processors.excerpt',
+))
+
+# How many words of a page's text go in its excerpt.
+EXCERPT_WORDS = getattr(settings, 'FLATPAGES_PLUS_EXCERPT_WORDS', 50)
+
+# The Cache-Control header sent with flatpages anyone can see, e.g. 
+# 'public, max-age=300'. Pages that are drafts or need a login are sent with
+# 'private'. Leave empty to send no Cache-Control header.
+CACHE_CONTROL = getattr(settings, 'FLATPAGES_PLUS_CACHE_CONTROL', '')
+
+# Whether to tag responses with surrogate keys for a caching proxy, and the
+# header to send them in.
+SURROGATE_KEYS = getattr(settings, 'FLATPAGES_PLUS_SURROGATE_KEYS', False)
+SURROGATE_KEY_HEADER = getattr(settings, 'FLATPAGES_PLUS_SURROGATE_KEY_HEADER', 
+    'Surrogate-Key')
+
+# How changed pages are purged from a caching proxy: 'null', 'http' or the 
+# dotted path to a purger class. See flatpages_plus/purging.py.
+PURGE_BACKEND = getattr(settings, 'FLATPAGES_PLUS_PURGE_BACKEND', 'null')
+
+# Where the 'http' purger sends purges, which HTTP method it uses, and how
+# long it waits for a reply (in seconds).
+PURGE_URL = getattr(settings, 'FLATPAGES_PLUS_PURGE_URL', '')
+PURGE_METHOD = getattr(settings, 'FLATPAGES_PLUS_PURGE_METHOD', 'PURGE')
+PURGE_TIMEOUT = getattr(settings, 'FLATPAGES_PLUS_PURGE_TIMEOUT', 5)
+
+# Queued purges are sent at the end of each request, or sooner once this 
+# many surrogate keys are waiting; each purge request carries at most this
+# many keys.
+PURGE_BATCH_SIZE = getattr(settings, 'FLATPAGES_PLUS_PURGE_BATCH_SIZE', 100)
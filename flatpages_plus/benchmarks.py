@@ -0,0 +1,230 @@
+"""
+Benchmarks for the flatpage view, the fallback middleware, the manager and
+the ``get_flatpages`` template tag.
+
+Run them with ``manage.py benchmark_flatpages``, which seeds a throwaway 
+SQLite test database and keeps its cache entries apart from the site's, so 
+it never touches your real data.
+"""
+import os
+import random
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponseNotFound
+from django.template import Context, Template
+from django.test.client import RequestFactory
+from taggit.models import Tag, TaggedItem
+
+from flatpages_plus.middleware import FlatpageFallbackMiddleware
+from flatpages_plus.models import FlatPage, FlatPageRoute
+from flatpages_plus.routes import fix_routes
+from flatpages_plus.utils import bulk_insert, rebuild_tree
+from flatpages_plus.views import flatpage
+
+SORTS = ('modified', '-modified', 'created', '-created', 'views', '-views', 
+         'random')
+
+
+def generate_urls(count, depth, breadth):
+    """
+    Return ``count`` URLs forming a tree at most ``depth`` levels deep with
+    up to ``breadth`` pages below each page.
+    
+    Raises ValueError if the tree can't hold ``count`` pages.
+    """
+    capacity = sum([breadth ** level for level in range(depth + 1)])
+    if count > capacity:
+        raise ValueError("A tree %d levels deep with %d pages below each "
+            "page only holds %d pages, not %d. Increase the depth or "
+            "breadth." % (depth, breadth, capacity, count))
+    urls = ['/']
+    level = ['/']
+    while len(urls) < count and level and depth:
+        next_level = []
+        for parent in level:
+            for i in range(breadth):
+                url = '%spage-%d/' % (parent, i)
+                urls.append(url)
+                next_level.append(url)
+                if len(urls) >= count:
+                    return urls
+        level = next_level
+        depth -= 1
+    return urls
+
+class isolated_cache(object):
+    """
+    Gives every cache key a prefix of its own while the benchmarks run, so 
+    they start with an empty cache and neither read nor overwrite the 
+    cached flatpages of a cache shared with the site.
+    """
+    
+    def __enter__(self):
+        self.key_prefix = cache.key_prefix
+        cache.key_prefix = 'flatpages_plus_benchmark:%d:%d' % (os.getpid(), 
+            int(time.time() * 1000))
+        return cache
+    
+    def __exit__(self, *exc_info):
+        cache.key_prefix = self.key_prefix
+
+def seed(pages=1000, depth=4, breadth=10, tags=50, tags_per_page=3, 
+         site_id=1, batch_size=500, seed=0):
+    """
+    Fill the database with ``pages`` flatpages spread over a URL tree, each 
+    with ``tags_per_page`` tags picked from ``tags`` tag names. Run it and 
+    the benchmarks inside ``isolated_cache()``.
+    """
+    rng = random.Random(seed)
+    owner, created = User.objects.get_or_create(username='benchmark')
+    urls = generate_urls(pages, depth, breadth)
+    for start in range(0, len(urls), batch_size):
+        bulk_insert(FlatPage, [FlatPage(
+            url=url, title='Page %s' % url, name=url.strip('/').split('/')[-1],
+            content='<p>%s</p>' % ('Lorem ipsum dolor sit amet. ' * 40),
+            owner=owner, status='p', views=rng.randint(0, 10000),
+        ) for url in urls[start:start + batch_size]])
+    
+    page_ids = list(FlatPage.objects.values_list('pk', flat=True))
+    through = FlatPage.sites.through
+    for start in range(0, len(page_ids), batch_size):
+        bulk_insert(through, [through(flatpage_id=pk, site_id=site_id)
+            for pk in page_ids[start:start + batch_size]])
+    # Parents and routes are found per site, so these have to wait for the 
+    # sites.
+    rebuild_tree(FlatPage)
+    fix_routes(FlatPage, FlatPageRoute, batch_size)
+    
+    tag_objects = [Tag.objects.create(name='tag-%d' % i, slug='tag-%d' % i)
+                   for i in range(tags)]
+    content_type = ContentType.objects.get_for_model(FlatPage)
+    items = []
+    for pk in page_ids:
+        for tag in rng.sample(tag_objects, min(tags_per_page, len(tag_objects))):
+            items.append(TaggedItem(tag=tag, content_type=content_type, 
+                                    object_id=pk))
+    for start in range(0, len(items), batch_size):
+        bulk_insert(TaggedItem, items[start:start + batch_size])
+    return urls
+
+def percentile(timings, percent):
+    timings = sorted(timings)
+    index = int(round((len(timings) - 1) * percent / 100.0))
+    return timings[index]
+
+def measure(func, args_list, warmup=10):
+    """
+    Call ``func`` with each set of arguments in ``args_list`` and return the 
+    latency percentiles (in milliseconds) and the average number of queries.
+    
+    Queries are counted in a separate pass so the debug cursor doesn't 
+    inflate the timings.
+    """
+    for args in args_list[:warmup]:
+        func(*args)
+    
+    timings = []
+    for args in args_list:
+        start = time.time()
+        func(*args)
+        timings.append((time.time() - start) * 1000)
+    
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    queries = 0
+    try:
+        for args in args_list:
+            connection.queries = []
+            func(*args)
+            queries += len(connection.queries)
+    finally:
+        connection.use_debug_cursor = use_debug_cursor
+    
+    return {
+        'iterations': len(timings),
+        'mean': sum(timings) / len(timings),
+        'min': min(timings),
+        'p50': percentile(timings, 50),
+        'p90': percentile(timings, 90),
+        'p99': percentile(timings, 99),
+        'max': max(timings),
+        'queries': float(queries) / len(args_list),
+    }
+
+def run(urls, iterations=200, tags=50, seed=0):
+    """
+    Run every benchmark and return a dictionary of results by name.
+    """
+    rng = random.Random(seed)
+    factory = RequestFactory()
+    middleware = FlatpageFallbackMiddleware()
+    
+    def request(url):
+        request = factory.get(url)
+        request.user = AnonymousUser()
+        return request
+    
+    def call_view(url):
+        flatpage(request(url), url)
+    
+    def call_middleware(url):
+        middleware.process_response(request(url), HttpResponseNotFound())
+    
+    def call_manager(kwargs):
+        list(FlatPage.objects.get_flatpages(**kwargs))
+    
+    def render_tag(template):
+        template.render(Context())
+    
+    hits = [(rng.choice(urls),) for i in range(iterations)]
+    misses = [('/wp-admin/%d/' % i,) for i in range(iterations)]
+    tag_names = ['tag-%d' % i for i in range(tags)] or ['tag-0']
+    
+    results = {}
+    results['view'] = measure(call_view, hits)
+    results['middleware:hit'] = measure(call_middleware, hits)
+    results['middleware:miss'] = measure(call_middleware, misses)
+    
+    for sort in SORTS:
+        filters = {
+            '': {},
+            'tags': {'tags': rng.choice(tag_names)},
+            'not_tags': {'not_tags': rng.choice(tag_names)},
+            'starts_with': {'starts_with': '/page-0/'},
+            'owners': {'owners': '1'},
+            'remove': {'remove': '1'},
+        }
+        for name, kwargs in filters.items():
+            kwargs = dict(kwargs, sort=sort, limit=10)
+            key = 'get_flatpages:%s%s' % (sort, name and ':' + name)
+            results[key] = measure(call_manager, [(kwargs,)] * iterations)
+    
+    for name, tag in (
+            ('views', "{% get_flatpages sort='views' limit=10 as fp %}"),
+            ('random', "{% get_flatpages sort='random' limit=5 as fp %}"),
+            ('views:cached', 
+             "{% get_flatpages sort='views' limit=10 cache=300 as fp %}")):
+        template = Template('{% load flatpages_plus_tags %}' + tag +
+                            '{% for f in fp %}{{ f.url }}{% endfor %}')
+        results['get_flatpages_tag:%s' % name] = measure(render_tag, 
+            [(template,)] * iterations)
+    
+    return results
+
+def compare(results, baseline):
+    """
+    Return ``(name, baseline p50, p50, change)`` for every benchmark in both
+    result sets, where change is the relative difference in the median.
+    """
+    rows = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['p50'], results[name]['p50']
+        change = before and (after - before) / before
+        rows.append((name, before, after, change))
+    return rows
@@ -0,0 +1,55 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation, make_key
+from flatpages_plus.models import FlatPage
+from flatpages_plus.utils import get_ancestor_urls
+
+# Matches the last section of a URL (the page's slug).
+URL_SLUG_RE = re.compile(r'.*/(?P<url>[-\w\.]+)/?$')
+
+
+def get_breadcrumbs(page, site_id=None):
+    """
+    Return a list of ``{'url': ..., 'name': ...}`` dictionaries, one for each
+    level of ``page``'s URL, for use in breadcrumb navigation.
+    
+    Levels that don't have a flatpage get a name made from their URL slug and
+    a URL of None so they aren't linked to (which would cause a 404).
+    
+    The ancestors are looked up on the given site (the current site by 
+    default). They are all fetched with a single query and the result is 
+    cached until any flatpage changes.
+    """
+    if site_id is None:
+        site_id = settings.SITE_ID
+    key = make_key('breadcrumbs', get_generation(), site_id, page.url)
+    breadcrumbs = cache.get(key)
+    if breadcrumbs is not None:
+        return breadcrumbs
+    
+    urls = get_ancestor_urls(page.url)
+    names = dict(FlatPage.objects.filter(url__in=urls, 
+        sites__id__exact=site_id).values_list('url', 'name'))
+    names[page.url] = page.name
+    
+    breadcrumbs = []
+    for u in urls:
+        if u in names:
+            breadcrumbs.append({'url': u, 'name': names[u]})
+            continue
+        # Default to the URL slug of the last segment of the URL 
+        # (capitalized) if no flatpage was found. Worst case scenario we 
+        # show the URL itself.
+        match = URL_SLUG_RE.match(u)
+        if match:
+            name = match.group('url')
+        else:
+            name = u
+        breadcrumbs.append({'url': None, 'name': name.capitalize()})
+    
+    cache.set(key, breadcrumbs, app_settings.CACHE_TIMEOUT)
+    return breadcrumbs
@@ -0,0 +1,227 @@
+"""
+Streams flatpages to and from JSON Lines files, one page per line, for 
+``manage.py dump_flatpages`` and ``manage.py load_flatpages``.
+
+Pages are read and written in batches, so memory use doesn't grow with the
+number of pages, and imported pages are inserted with ``bulk_create`` (one
+at a time on Django 1.3).
+"""
+from __future__ import with_statement
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max
+from django.utils import simplejson
+from taggit.models import Tag, TaggedItem
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import bump_generation
+from flatpages_plus.lookup import clear_lookup_cache
+from flatpages_plus.models import FlatPage, FlatPageRoute
+from flatpages_plus.purging import purge_all
+from flatpages_plus.related import rebuild_related
+from flatpages_plus.search import index_pages
+from flatpages_plus.utils import bulk_insert, rebuild_tree
+
+FIELDS = ('url', 'title', 'name', 'content', 'status', 'views', 
+          'enable_comments', 'template_name', 'registration_required')
+DATE_FIELDS = ('created', 'modified')
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Each batch's IDs, URLs or tag names go into a single IN list, and SQLite 
+# allows 999 parameters per query.
+MAX_BATCH_SIZE = 500
+
+
+def batches(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_page_tags(page_ids):
+    """Return ``{page_id: [tag names]}`` for the given pages, in one query."""
+    content_type = ContentType.objects.get_for_model(FlatPage)
+    tags = {}
+    for page_id, name in TaggedItem.objects.filter(content_type=content_type,
+            object_id__in=page_ids).values_list('object_id', 'tag__name'):
+        tags.setdefault(page_id, []).append(name)
+    return tags
+
+def dump(output, site_id, batch_size=MAX_BATCH_SIZE):
+    """
+    Write every flatpage on the site to ``output`` as JSON Lines, reading up
+    to ``batch_size`` (at most ``MAX_BATCH_SIZE``) pages at a time. Returns 
+    how many pages were written.
+    """
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    count = 0
+    last_pk = 0
+    values = ('pk', 'owner') + FIELDS + DATE_FIELDS
+    while True:
+        pages = list(FlatPage.objects.filter(sites__id__exact=site_id, 
+            pk__gt=last_pk).order_by('pk').values(*values)[:batch_size])
+        if not pages:
+            break
+        page_ids = [page['pk'] for page in pages]
+        tags = get_page_tags(page_ids)
+        owners = dict(User.objects.filter(pk__in=set([page['owner'] for 
+            page in pages])).values_list('pk', 'username'))
+        for page in pages:
+            record = dict([(field, page[field]) for field in FIELDS])
+            for field in DATE_FIELDS:
+                if page[field] is not None:
+                    record[field] = page[field].strftime(DATE_FORMAT)
+            record['owner'] = owners.get(page['owner'])
+            record['tags'] = sorted(tags.get(page['pk'], []))
+            output.write(simplejson.dumps(record, sort_keys=True) + '\n')
+        count += len(pages)
+        last_pk = page_ids[-1]
+    return count
+
+def parse_date(value):
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+class Loader(object):
+    """
+    Loads JSON Lines flatpages into a site in batches.
+    
+    Pages are matched to existing pages by URL. Existing pages are updated 
+    if ``update`` is True and skipped otherwise; new pages are inserted in 
+    bulk. Owners are matched by username, falling back to the user with the
+    ID ``default_owner``. If ``keep_dates`` is True, the pages' created and 
+    modified times are copied from the file, which costs an extra query per
+    page. Batches are at most ``MAX_BATCH_SIZE`` pages.
+    """
+    
+    def __init__(self, site_id, batch_size=MAX_BATCH_SIZE, update=True, 
+                 default_owner=1, keep_dates=False):
+        self.site_id = site_id
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.update = update
+        self.default_owner = default_owner
+        self.keep_dates = keep_dates
+        self.content_type = ContentType.objects.get_for_model(FlatPage)
+        self.tags = {}
+        self.owners = {}
+        self.created = self.updated = self.skipped = 0
+    
+    def load(self, lines):
+        records = (simplejson.loads(line) for line in lines if line.strip())
+        for batch in batches(records, self.batch_size):
+            with transaction.commit_on_success():
+                self.load_batch(batch)
+        # bulk_create and update() don't send signals, so tidy up after them.
+        # (On Django 1.3 the inserts do, and this is just redundant.)
+        rebuild_tree(FlatPage)
+        if app_settings.RELATED_PAGES:
+            rebuild_related()
+        bump_generation()
+        clear_lookup_cache()
+        purge_all()
+        return self.created, self.updated, self.skipped
+    
+    def get_owner_ids(self, records):
+        usernames = set([r.get('owner') for r in records if r.get('owner')])
+        missing = [u for u in usernames if u not in self.owners]
+        if missing:
+            self.owners.update(dict(User.objects.filter(
+                username__in=missing).values_list('username', 'pk')))
+        return dict([(u, self.owners.get(u, self.default_owner)) 
+                     for u in usernames])
+    
+    def get_tag_ids(self, records):
+        names = set()
+        for record in records:
+            names.update(record.get('tags') or [])
+        missing = [name for name in names if name not in self.tags]
+        if missing:
+            # The pages in a batch can have more tags than fit in one query.
+            for names in batches(missing, MAX_BATCH_SIZE):
+                self.tags.update(dict(Tag.objects.filter(
+                    name__in=names).values_list('name', 'pk')))
+            for name in missing:
+                if name not in self.tags:
+                    # Let taggit work out a unique slug.
+                    self.tags[name] = Tag.objects.create(name=name).pk
+        return self.tags
+    
+    def load_batch(self, records):
+        records = dict([(r['url'], r) for r in records])
+        owner_ids = self.get_owner_ids(records.values())
+        tag_ids = self.get_tag_ids(records.values())
+        
+        existing = dict(FlatPageRoute.objects.filter(site=self.site_id,
+            url__in=records.keys()).values_list('url', 'page'))
+        
+        touched = {}
+        with_tags = {}
+        new_pages = []
+        for url, record in records.items():
+            fields = dict([(f, record[f]) for f in FIELDS if f in record])
+            if 'views' in fields and fields['views'] is None:
+                fields['views'] = 0
+            fields['owner_id'] = owner_ids.get(record.get('owner'), 
+                                               self.default_owner)
+            if url in existing:
+                if not self.update:
+                    self.skipped += 1
+                    continue
+                fields['modified'] = datetime.datetime.now()
+                # update() skips save(), so run the content processors here.
+                page = FlatPage(**fields)
+                page.process_content()
+                fields.update(page.get_processed_fields())
+                # update() takes the field's name rather than its column.
+                fields['owner'] = fields.pop('owner_id')
+                FlatPage.objects.filter(pk=existing[url]).update(**fields)
+                touched[url] = existing[url]
+                with_tags[existing[url]] = record.get('tags') or []
+                self.updated += 1
+            else:
+                page = FlatPage(**fields)
+                page.process_content()
+                new_pages.append(page)
+        
+        if new_pages:
+            # bulk_insert doesn't give us the new IDs, but the new pages are
+            # the only ones with these URLs above the highest existing ID.
+            last_pk = FlatPage.objects.aggregate(last_pk=Max('pk'))['last_pk']
+            bulk_insert(FlatPage, new_pages)
+            created = dict(FlatPage.objects.filter(pk__gt=last_pk or 0, 
+                url__in=[p.url for p in new_pages]).values_list('url', 'pk'))
+            through = FlatPage.sites.through
+            bulk_insert(through, [through(flatpage_id=pk, 
+                site_id=self.site_id) for pk in created.values()])
+            bulk_insert(FlatPageRoute, [FlatPageRoute(page_id=pk, 
+                site_id=self.site_id, url=url) for url, pk in created.items()])
+            for url, pk in created.items():
+                with_tags[pk] = records[url].get('tags') or []
+            self.created += len(created)
+            touched.update(created)
+        
+        if with_tags:
+            TaggedItem.objects.filter(content_type=self.content_type, 
+                object_id__in=with_tags.keys()).delete()
+            bulk_insert(TaggedItem, [TaggedItem(tag_id=tag_ids[name],
+                content_type=self.content_type, object_id=pk) 
+                for pk, names in with_tags.items() for name in set(names)])
+        
+        index_pages(touched.values())
+        
+        if self.keep_dates:
+            for url, pk in touched.items():
+                dates = dict([(f, parse_date(records[url].get(f))) for f in 
+                              DATE_FIELDS if records[url].get(f)])
+                if dates:
+                    FlatPage.objects.filter(pk=pk).update(**dates)
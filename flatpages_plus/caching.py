@@ -0,0 +1,69 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import transaction
+from django.utils.encoding import force_unicode
+
+GENERATION_KEY = 'flatpages_plus:generation'
+# The generation is seeded from the clock (see below), so it is safe to let
+# it expire; it just shouldn't happen often.
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def make_key(prefix, *parts):
+    """
+    Build a cache key that is safe to use with any backend, no matter what 
+    characters (or how many) the URL and other parts contain.
+    """
+    parts = u':'.join([force_unicode(p) for p in parts])
+    return 'flatpages_plus:%s:%s' % (prefix, 
+        hashlib.md5(parts.encode('utf-8')).hexdigest())
+
+def get_generation():
+    """
+    Return the current flatpages generation.
+    
+    The generation changes every time any flatpage changes, so including it 
+    in a cache key invalidates everything derived from the flatpages without 
+    having to track down individual keys.
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed with the time rather than 1 so that if the key is ever evicted
+        # we don't go back to a generation that has already been used.
+        generation = int(time.time() * 1000)
+        if not cache.add(GENERATION_KEY, generation, GENERATION_TIMEOUT):
+            generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+_pending = threading.local()
+
+def _incr_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+def bump_generation():
+    """
+    Invalidate everything cached against the current generation.
+    
+    Inside a managed transaction (the admin's, for example) other requests 
+    can't see the change until it's committed, and may cache the old data 
+    under the new generation in the meantime. So the generation is bumped 
+    again when the request finishes, after the transaction is committed.
+    """
+    _incr_generation()
+    if transaction.is_managed():
+        _pending.bump = True
+
+def bump_pending_generation(**kwargs):
+    if getattr(_pending, 'bump', False):
+        _pending.bump = False
+        _incr_generation()
+
+request_finished.connect(bump_pending_generation, 
+    dispatch_uid='flatpages_plus.bump_pending_generation')
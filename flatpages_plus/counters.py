@@ -0,0 +1,241 @@
+import atexit
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.importlib import import_module
+
+from flatpages_plus import app_settings
+from flatpages_plus.models import FlatPage
+
+VIEW_COUNT_KEY = 'flatpages_plus:views:%s'
+# Each page with pending views is written to the next numbered slot, so a 
+# flush only has to look at the slots filled since the last one.
+PENDING_COUNT_KEY = 'flatpages_plus:pending_views'
+PENDING_SLOT_KEY = 'flatpages_plus:pending_views:%s'
+FLUSHED_COUNT_KEY = 'flatpages_plus:flushed_views'
+RETRY_SLOTS_KEY = 'flatpages_plus:retry_views'
+# Keep pending views around long enough for an infrequent flush to see them.
+VIEW_COUNT_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def apply_view_counts(counts):
+    """
+    Write a dictionary of ``{page_id: views}`` to the database, using one
+    ``UPDATE ... SET views = views + n`` per page.
+    
+    Pages that are counted in bulk never go through ``FlatPage.save()``, so
+    the ``modified`` timestamp is left alone and concurrent increments are
+    never lost.
+    """
+    for page_id, views in counts.items():
+        if views:
+            FlatPage.objects.filter(pk=page_id).update(views=F('views') + views)
+    return sum(counts.values())
+
+
+class BaseViewCounter(object):
+    """
+    The interface every view counter has to provide.
+    """
+    
+    def record(self, page):
+        """Count a single view of ``page``."""
+        raise NotImplementedError
+    
+    def flush(self):
+        """Write any pending views to the database and return how many."""
+        return 0
+
+
+class DisabledViewCounter(BaseViewCounter):
+    """
+    Doesn't count page views at all.
+    """
+    
+    def record(self, page):
+        pass
+
+
+class SyncViewCounter(BaseViewCounter):
+    """
+    Counts every view straight away with a single-column UPDATE.
+    """
+    
+    def record(self, page):
+        apply_view_counts({page.pk: 1})
+        # Keep the instance in step with the database for the template.
+        page.views = (page.views or 0) + 1
+
+
+class BufferedViewCounter(BaseViewCounter):
+    """
+    Accumulates views in process memory and writes them out in bulk.
+    
+    Pending views are flushed when the buffer is older than
+    ``FLATPAGES_PLUS_VIEW_COUNTER_FLUSH_INTERVAL`` seconds, when it holds more
+    than ``FLATPAGES_PLUS_VIEW_COUNTER_FLUSH_THRESHOLD`` views, and when the
+    process exits.
+    """
+    
+    def __init__(self, interval=None, threshold=None):
+        if interval is None:
+            interval = app_settings.VIEW_COUNTER_FLUSH_INTERVAL
+        if threshold is None:
+            threshold = app_settings.VIEW_COUNTER_FLUSH_THRESHOLD
+        self.interval = interval
+        self.threshold = threshold
+        self._counts = {}
+        self._pending = 0
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def record(self, page):
+        self._lock.acquire()
+        try:
+            self._counts[page.pk] = self._counts.get(page.pk, 0) + 1
+            self._pending += 1
+            due = (self._pending >= self.threshold or
+                   time.time() - self._last_flush >= self.interval)
+        finally:
+            self._lock.release()
+        if due:
+            self.flush()
+    
+    def flush(self):
+        # Swap the buffer out under the lock so the database writes don't 
+        # block other requests from recording views.
+        self._lock.acquire()
+        try:
+            counts, self._counts = self._counts, {}
+            self._pending = 0
+            self._last_flush = time.time()
+        finally:
+            self._lock.release()
+        return apply_view_counts(counts)
+
+
+class CacheViewCounter(BaseViewCounter):
+    """
+    Accumulates views in the cache so they are shared between processes.
+    
+    Nothing is written to the database until ``flush()`` is called, normally 
+    from a cron job running ``manage.py flush_flatpage_views``. Only the 
+    pages viewed since the last flush are looked at, and only one flush 
+    should run at a time.
+    """
+    
+    def record(self, page):
+        key = VIEW_COUNT_KEY % page.pk
+        # add() is a no-op if the key already exists, which makes this safe
+        # to race against other processes.
+        if cache.add(key, 1, VIEW_COUNT_TIMEOUT):
+            self.add_pending(page.pk)
+            return
+        try:
+            views = cache.incr(key)
+        except ValueError:
+            # The key expired between add() and incr().
+            if cache.add(key, 1, VIEW_COUNT_TIMEOUT):
+                self.add_pending(page.pk)
+            return
+        if views == 1:
+            # The count was flushed back to zero since the last view.
+            self.add_pending(page.pk)
+    
+    def add_pending(self, page_id):
+        """Note that a page has views waiting to be flushed."""
+        if cache.add(PENDING_COUNT_KEY, 1, VIEW_COUNT_TIMEOUT):
+            slot = 1
+        else:
+            try:
+                slot = cache.incr(PENDING_COUNT_KEY)
+            except ValueError:
+                # The counter expired between add() and incr().
+                slot = 1
+                cache.set(PENDING_COUNT_KEY, slot, VIEW_COUNT_TIMEOUT)
+        cache.set(PENDING_SLOT_KEY % slot, page_id, VIEW_COUNT_TIMEOUT)
+    
+    def get_pending(self):
+        """
+        Return the IDs of the pages with views recorded since the last flush.
+        
+        A slot can be taken but not yet filled in while we read it, so empty
+        slots are looked at again on the next flush before they're given up.
+        """
+        last_slot = cache.get(PENDING_COUNT_KEY) or 0
+        flushed = cache.get(FLUSHED_COUNT_KEY) or 0
+        if flushed > last_slot:
+            # The counter expired and started again.
+            flushed = 0
+        retry = cache.get(RETRY_SLOTS_KEY) or []
+        slots = retry + list(range(flushed + 1, last_slot + 1))
+        page_ids = set()
+        empty = []
+        for start in range(0, len(slots), 500):
+            keys = [PENDING_SLOT_KEY % slot for slot in slots[start:start + 500]]
+            found = cache.get_many(keys)
+            for slot, key in zip(slots[start:start + 500], keys):
+                if key in found:
+                    page_ids.add(found[key])
+                elif slot > flushed:
+                    empty.append(slot)
+            cache.delete_many(found.keys())
+        cache.set(FLUSHED_COUNT_KEY, last_slot, VIEW_COUNT_TIMEOUT)
+        cache.set(RETRY_SLOTS_KEY, empty, VIEW_COUNT_TIMEOUT)
+        return sorted(page_ids)
+    
+    def flush(self):
+        counts = {}
+        page_ids = self.get_pending()
+        for start in range(0, len(page_ids), 500):
+            keys = [VIEW_COUNT_KEY % pk for pk in page_ids[start:start + 500]]
+            for key, views in cache.get_many(keys).items():
+                if not views:
+                    continue
+                # Subtract what we read rather than deleting the key, so 
+                # views recorded while we're flushing aren't lost.
+                try:
+                    left = cache.decr(key, views)
+                except ValueError:
+                    continue
+                page_id = int(key.rsplit(':', 1)[1])
+                counts[page_id] = views
+                if left:
+                    self.add_pending(page_id)
+        return apply_view_counts(counts)
+
+
+VIEW_COUNTERS = {
+    'sync': SyncViewCounter,
+    'buffered': BufferedViewCounter,
+    'cache': CacheViewCounter,
+    'disabled': DisabledViewCounter,
+}
+
+_view_counter = None
+
+def get_view_counter():
+    """
+    Return the view counter selected by ``FLATPAGES_PLUS_VIEW_COUNTER``.
+    """
+    global _view_counter
+    if _view_counter is None:
+        name = app_settings.VIEW_COUNTER
+        if name in VIEW_COUNTERS:
+            counter_class = VIEW_COUNTERS[name]
+        else:
+            module, attr = name.rsplit('.', 1)
+            counter_class = getattr(import_module(module), attr)
+        _view_counter = counter_class()
+    return _view_counter
+
+def record_view(page):
+    """Count a view of ``page`` with the configured view counter."""
+    get_view_counter().record(page)
+
+def flush_views():
+    """Flush any buffered views to the database."""
+    return get_view_counter().flush()
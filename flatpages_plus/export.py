@@ -0,0 +1,148 @@
+"""
+Exports flatpages as static HTML files, for ``manage.py export_flatpages``.
+"""
+import errno
+import hashlib
+import os
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test.client import RequestFactory
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+
+from flatpages_plus import app_settings
+from flatpages_plus.models import FlatPage
+from flatpages_plus.template_cache import find_template_paths, get_mtime
+from flatpages_plus.utils import get_ancestor_urls
+from flatpages_plus.views import DEFAULT_TEMPLATE, render_flatpage_content
+
+MANIFEST_NAME = '.flatpages_manifest.json'
+
+
+def get_output_path(output_dir, url):
+    """Return the file a page at ``url`` is written to."""
+    return os.path.join(output_dir, url.strip('/'), 'index.html')
+
+def get_template_version(template_name):
+    """
+    Return something that changes when a page's template, or a template it 
+    extends or includes, changes.
+    """
+    names = [DEFAULT_TEMPLATE]
+    if template_name:
+        names.insert(0, template_name)
+    for name in names:
+        paths = find_template_paths(name)
+        if paths:
+            return ':'.join(['%s:%s' % (path, get_mtime(path)) 
+                             for path in paths])
+    return ''
+
+def get_signatures(site_id):
+    """
+    Return ``{url: (page_id, signature)}`` for every page to export, where the
+    signature changes whenever the page would render differently: when it's
+    modified, when one of its breadcrumbs is renamed, or when its template 
+    changes.
+    """
+    names = dict(FlatPage.objects.filter(sites__id__exact=site_id)
+                                 .values_list('url', 'name'))
+    pages = FlatPage.objects.filter(sites__id__exact=site_id, status='p', 
+        registration_required=False).values_list('pk', 'url', 'modified', 
+                                                  'template_name')
+    template_versions = {}
+    signatures = {}
+    for pk, url, modified, template_name in pages:
+        if template_name not in template_versions:
+            template_versions[template_name] = get_template_version(template_name)
+        parts = [modified, template_name, template_versions[template_name], 
+                 app_settings.TEMPLATE_VERSION]
+        parts.extend([names.get(u, '') for u in get_ancestor_urls(url)])
+        signature = hashlib.md5(':'.join([smart_str(p) for p in parts])).hexdigest()
+        signatures[url] = (pk, signature)
+    return signatures
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    manifest = open(path)
+    try:
+        return simplejson.load(manifest)
+    finally:
+        manifest.close()
+
+def save_manifest(output_dir, manifest):
+    manifest_file = open(os.path.join(output_dir, MANIFEST_NAME), 'w')
+    try:
+        simplejson.dump(manifest, manifest_file, indent=0, sort_keys=True)
+    finally:
+        manifest_file.close()
+
+def render_pages(args):
+    """
+    Render a batch of pages to files. Runs in the worker processes, so it 
+    takes a single tuple of ``(output_dir, site_id, page_ids)``.
+    """
+    output_dir, site_id, page_ids = args
+    factory = RequestFactory()
+    urls = []
+    for page in FlatPage.objects.filter(pk__in=page_ids):
+        request = factory.get(page.url)
+        request.user = AnonymousUser()
+        content = render_flatpage_content(request, page, site_id)
+        path = get_output_path(output_dir, page.url)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        output = open(path, 'w')
+        try:
+            output.write(smart_str(content))
+        finally:
+            output.close()
+        urls.append(page.url)
+    return urls
+
+def export(output_dir, site_id, processes=1, batch_size=100, force=False):
+    """
+    Render every published page on the site that has changed since the last
+    export into ``output_dir``, and delete the files of pages that are gone.
+    
+    Returns the number of pages written and the number removed.
+    """
+    manifest = {}
+    if not force:
+        manifest = load_manifest(output_dir)
+    signatures = get_signatures(site_id)
+    
+    changed = [pk for url, (pk, signature) in signatures.items() 
+               if manifest.get(url) != signature]
+    batches = [(output_dir, site_id, changed[start:start + batch_size]) 
+               for start in range(0, len(changed), batch_size)]
+    
+    if processes > 1 and len(batches) > 1:
+        from multiprocessing import Pool
+        # Each worker needs its own database connection.
+        connection.close()
+        pool = Pool(processes)
+        try:
+            pool.map(render_pages, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for batch in batches:
+            render_pages(batch)
+    
+    removed = [url for url in manifest if url not in signatures]
+    for url in removed:
+        path = get_output_path(output_dir, url)
+        if os.path.exists(path):
+            os.remove(path)
+    
+    save_manifest(output_dir, dict([(url, signature) for url, (pk, signature)
+                                    in signatures.items()]))
+    return len(changed), len(removed)
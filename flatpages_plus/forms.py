@@ -1,6 +1,9 @@
 from django import forms
+from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 
+from taggit.forms import TagField
+
 from flatpages_plus.models import FlatPage
 
 
@@ -13,3 +16,33 @@ class FlatpageForm(forms.ModelForm):
 
     class Meta:
         model = FlatPage
+
+    def clean(self):
+        url = self.cleaned_data.get('url')
+        sites = self.cleaned_data.get('sites')
+        if url and sites:
+            same_url = FlatPage.objects.filter(url=url)
+            if self.instance.pk:
+                same_url = same_url.exclude(pk=self.instance.pk)
+            for site in sites:
+                if same_url.filter(sites=site).exists():
+                    raise forms.ValidationError(
+                        _('Flatpage with url %(url)s already exists for site '
+                          '%(site)s') % {'url': url, 'site': site})
+        return super(FlatpageForm, self).clean()
+
+
+class ReassignOwnerForm(forms.Form):
+    owner = forms.ModelChoiceField(label=_("New owner"), 
+        queryset=User.objects.order_by('username'))
+
+
+class RetagForm(forms.Form):
+    ADD, REMOVE = 'add', 'remove'
+    
+    tags = TagField(label=_("Tags"), help_text=_("A comma seperated list of "
+                                                 "tags."))
+    mode = forms.ChoiceField(label=_("Action"), choices=(
+        (ADD, _('Add these tags to the selected pages')),
+        (REMOVE, _('Remove these tags from the selected pages')),
+    ))
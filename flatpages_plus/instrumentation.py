@@ -0,0 +1,160 @@
+"""
+Per-request timings for the flatpage view and middleware.
+
+When ``FLATPAGES_PLUS_INSTRUMENTATION`` is on, each phase of a flatpage 
+request (the page lookup, breadcrumbs, rendering, etc.) is timed and the 
+``flatpage_timings`` signal is sent with the results once the request is 
+done. When it's off, every hook returns straight away.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+from django.utils.functional import wraps
+
+from flatpages_plus import app_settings
+
+# Sent with a Timings instance once the outermost instrumented call returns.
+flatpage_timings = Signal(providing_args=['request', 'timings'])
+
+_local = threading.local()
+
+
+def query_count():
+    """
+    Return how many queries have run on this connection, or None if Django
+    isn't recording them (it only does when DEBUG is on).
+    """
+    if settings.DEBUG or connection.use_debug_cursor:
+        return len(connection.queries)
+    return None
+
+
+class Timings(object):
+    """
+    The phases of one request, with how long (in milliseconds) and how many
+    queries each took, and the outcome of each cache that was consulted.
+    """
+    
+    def __init__(self, request):
+        self.request = request
+        self.phases = []
+        self.outcomes = {}
+        self.depth = 0
+        self.started = time.time()
+        self.total = None
+    
+    def add(self, name, duration, queries=None):
+        self.phases.append((name, duration, queries))
+    
+    def server_timing(self):
+        """Return the timings formatted for a Server-Timing header."""
+        entries = ['%s;dur=%.2f' % (name, duration) 
+                   for name, duration, queries in self.phases]
+        entries.extend(['%s;desc=%s' % item 
+                        for item in sorted(self.outcomes.items())])
+        if self.total is not None:
+            entries.append('total;dur=%.2f' % self.total)
+        return ', '.join(entries)
+
+
+class Phase(object):
+    """
+    Times the code in a ``with`` block as a phase of the current request.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __enter__(self):
+        self.timings = getattr(_local, 'timings', None)
+        if self.timings is not None:
+            self.queries = query_count()
+            self.started = time.time()
+        return self
+    
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            queries = self.queries
+            if queries is not None:
+                queries = query_count() - queries
+            self.timings.add(self.name, (time.time() - self.started) * 1000, 
+                             queries)
+        return False
+
+
+class NullPhase(object):
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_PHASE = NullPhase()
+
+
+def phase(name):
+    """
+    Return a context manager that times its block as the phase ``name``::
+    
+        with phase('lookup'):
+            page = get_flatpage_or_404(url)
+    """
+    if not app_settings.INSTRUMENTATION:
+        return NULL_PHASE
+    return Phase(name)
+
+def note(name, outcome):
+    """
+    Record the outcome of something in the current request, e.g. 
+    ``note('lookup_cache', 'hit')``.
+    """
+    if not app_settings.INSTRUMENTATION:
+        return
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.outcomes[name] = outcome
+
+def start(request):
+    """
+    Start (or join, for nested calls) the timings for ``request``.
+    """
+    timings = getattr(_local, 'timings', None)
+    if timings is None or timings.request is not request:
+        timings = Timings(request)
+        _local.timings = timings
+    timings.depth += 1
+    return timings
+
+def finish(timings, response=None):
+    """
+    Finish a call started with ``start()``. When the outermost call finishes,
+    send the ``flatpage_timings`` signal and add the Server-Timing header.
+    """
+    timings.depth -= 1
+    if timings.depth > 0:
+        return
+    _local.timings = None
+    timings.total = (time.time() - timings.started) * 1000
+    flatpage_timings.send(sender=Timings, request=timings.request, 
+                          timings=timings)
+    if app_settings.SERVER_TIMING and response is not None:
+        response['Server-Timing'] = timings.server_timing()
+
+def instrumented(view):
+    """
+    Decorator that collects the timings for a view.
+    """
+    def wrapper(request, *args, **kwargs):
+        if not app_settings.INSTRUMENTATION:
+            return view(request, *args, **kwargs)
+        timings = start(request)
+        response = None
+        try:
+            response = view(request, *args, **kwargs)
+            return response
+        finally:
+            finish(timings, response)
+    return wraps(view)(wrapper)
@@ -0,0 +1,121 @@
+import copy
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.utils.datastructures import SortedDict
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation, make_key
+from flatpages_plus.instrumentation import note
+
+
+class DjangoCacheStore(object):
+    """
+    Keeps looked up flatpages in Django's cache framework.
+    """
+    
+    def get(self, key):
+        return cache.get(key)
+    
+    def set(self, key, page):
+        cache.set(key, page, app_settings.CACHE_TIMEOUT)
+    
+    def clear(self):
+        # Keys include the generation, so there's nothing to do.
+        pass
+
+
+class LRUStore(object):
+    """
+    Keeps the most recently used flatpages in process memory.
+    
+    Pages are copied on the way out, because the view marks the title and 
+    content as safe and bumps the view count on the instance it's given.
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self._pages = SortedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            page = self._pages.pop(key, None)
+            if page is None:
+                return None
+            # Move the page to the most recently used end.
+            self._pages[key] = page
+        finally:
+            self._lock.release()
+        return copy.copy(page)
+    
+    def set(self, key, page):
+        self._lock.acquire()
+        try:
+            self._pages.pop(key, None)
+            self._pages[key] = copy.copy(page)
+            while len(self._pages) > self.size:
+                del self._pages[self._pages.keyOrder[0]]
+        finally:
+            self._lock.release()
+    
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._pages = SortedDict()
+        finally:
+            self._lock.release()
+
+
+_store = None
+
+def get_lookup_store():
+    """
+    Return the store selected by ``FLATPAGES_PLUS_LOOKUP_CACHE``, or None if
+    lookups aren't cached.
+    """
+    global _store
+    if _store is None:
+        if app_settings.LOOKUP_CACHE == 'django':
+            _store = DjangoCacheStore()
+        elif app_settings.LOOKUP_CACHE == 'lru':
+            _store = LRUStore(app_settings.LOOKUP_CACHE_SIZE)
+    return _store
+
+def clear_lookup_cache():
+    store = get_lookup_store()
+    if store is not None:
+        store.clear()
+
+def get_flatpage_or_404(url, site_id=None):
+    """
+    Return the flatpage at ``url`` on the given site (the current site by 
+    default), raising Http404 if there isn't one.
+    
+    Found pages are cached against the flatpages generation, so they are 
+    dropped as soon as any flatpage or its sites change.
+    """
+    # Imported here so this module can be imported before the models.
+    from flatpages_plus.models import FlatPageRoute
+    if site_id is None:
+        site_id = settings.SITE_ID
+    store = get_lookup_store()
+    if store is not None:
+        key = make_key('page', get_generation(), site_id, url)
+        page = store.get(key)
+        note('lookup_cache', page is None and 'miss' or 'hit')
+        if page is not None:
+            return page
+    try:
+        # One probe of the routes' unique (site, url) index, rather than a
+        # join against the pages' sites.
+        page = FlatPageRoute.objects.select_related('page').get(
+            site=site_id, url__exact=url).page
+    except FlatPageRoute.DoesNotExist:
+        raise Http404('No flatpage matches the given query.')
+    if store is not None:
+        store.set(key, page)
+    return page
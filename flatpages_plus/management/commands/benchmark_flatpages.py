@@ -0,0 +1,90 @@
+from __future__ import with_statement
+
+import platform
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import simplejson
+
+from flatpages_plus import benchmarks
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--pages', action='store', dest='pages', type='int',
+            default=1000, help='How many flatpages to create.'),
+        make_option('--depth', action='store', dest='depth', type='int',
+            default=4, help='How deep the URL tree goes.'),
+        make_option('--breadth', action='store', dest='breadth', type='int',
+            default=10, help='How many pages there are below each page.'),
+        make_option('--tags', action='store', dest='tags', type='int',
+            default=50, help='How many different tags to use.'),
+        make_option('--tags-per-page', action='store', dest='tags_per_page',
+            type='int', default=3, help='How many tags each page gets.'),
+        make_option('--iterations', action='store', dest='iterations',
+            type='int', default=200, help='How many times to run each benchmark.'),
+        make_option('--output', action='store', dest='output', default=None,
+            help='Save the results to this JSON file, e.g. to use as a baseline.'),
+        make_option('--compare', action='store', dest='compare', default=None,
+            help='Compare the results with a baseline JSON file.'),
+    )
+    help = ("Benchmarks the flatpage view, fallback middleware, manager and "
+            "template tag against a freshly seeded SQLite test database.")
+    
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmarks only run against SQLite.")
+        verbosity = int(options.get('verbosity', 1))
+        try:
+            benchmarks.generate_urls(options['pages'], options['depth'], 
+                                     options['breadth'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        old_name = connection.creation.create_test_db(verbosity=0, 
+                                                       autoclobber=True)
+        try:
+            with benchmarks.isolated_cache():
+                if verbosity > 0:
+                    self.stdout.write("Seeding %d flatpages...\n" % 
+                                      options['pages'])
+                urls = benchmarks.seed(pages=options['pages'], 
+                    depth=options['depth'], breadth=options['breadth'], 
+                    tags=options['tags'], 
+                    tags_per_page=options['tags_per_page'])
+                results = benchmarks.run(urls, 
+                    iterations=options['iterations'], tags=options['tags'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        
+        self.stdout.write("%-45s %9s %9s %9s %9s\n" % 
+                          ('benchmark', 'p50 ms', 'p90 ms', 'p99 ms', 'queries'))
+        for name in sorted(results):
+            result = results[name]
+            self.stdout.write("%-45s %9.3f %9.3f %9.3f %9.1f\n" % (name, 
+                result['p50'], result['p90'], result['p99'], result['queries']))
+        
+        if options['compare']:
+            baseline = simplejson.load(open(options['compare']))
+            self.stdout.write("\n%-45s %9s %9s %9s\n" % 
+                              ('benchmark', 'before', 'after', 'change'))
+            for name, before, after, change in benchmarks.compare(results,
+                    baseline['results']):
+                self.stdout.write("%-45s %9.3f %9.3f %+8.1f%%\n" % (name, 
+                    before, after, change * 100))
+        
+        if options['output']:
+            data = {
+                'settings': dict([(key, options[key]) for key in ('pages', 
+                    'depth', 'breadth', 'tags', 'tags_per_page', 'iterations')]),
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'results': results,
+            }
+            output = open(options['output'], 'w')
+            try:
+                simplejson.dump(data, output, indent=2, sort_keys=True)
+            finally:
+                output.close()
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from flatpages_plus.caching import bump_generation
+from flatpages_plus.lookup import clear_lookup_cache
+from flatpages_plus.models import FlatPage, FlatPageRoute
+from flatpages_plus.routes import check_routes, fix_routes
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--fix', action='store_true', dest='fix', default=False,
+            help='Add the missing routes and remove the stale ones.'),
+    )
+    help = ("Checks that the flatpage routes match the pages' URLs and sites, "
+            "and reports URLs claimed by more than one page on a site.")
+    
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        missing, stale, conflicts = check_routes(FlatPage, FlatPageRoute)
+        if verbosity > 0:
+            for (site_id, url), page_ids in sorted(conflicts.items()):
+                self.stdout.write("Site %s: %s is claimed by pages %s.\n" % (
+                    site_id, url, ', '.join([str(pk) for pk in page_ids])))
+        if options['fix']:
+            added, removed = fix_routes(FlatPage, FlatPageRoute)
+            bump_generation()
+            clear_lookup_cache()
+            if verbosity > 0:
+                self.stdout.write("Added %d routes and removed %d.\n" % 
+                                  (added, removed))
+        elif missing or stale:
+            raise CommandError("%d routes are missing and %d are stale. Run "
+                "with --fix to repair them." % (len(missing), len(stale)))
+        elif verbosity > 0:
+            self.stdout.write("The flatpage routes are up to date.\n")
@@ -0,0 +1,36 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flatpages_plus.bulk import dump
+
+
+class Command(BaseCommand):
+    args = '[output_file]'
+    option_list = BaseCommand.option_list + (
+        make_option('--site', action='store', dest='site', type='int',
+            default=None, help='The ID of the site to dump. Defaults to '
+                'settings.SITE_ID.'),
+        make_option('--batch-size', action='store', dest='batch_size', 
+            type='int', default=500, 
+            help='How many pages to read from the database at a time '
+                '(at most 500).'),
+    )
+    help = ("Writes the flatpages on a site as JSON Lines (one page per line) "
+            "to a file, or to standard output.")
+    
+    def handle(self, *args, **options):
+        site_id = options['site'] or settings.SITE_ID
+        if args:
+            output = open(args[0], 'w')
+        else:
+            output = sys.stdout
+        try:
+            count = dump(output, site_id, batch_size=options['batch_size'])
+        finally:
+            if args:
+                output.close()
+        if args and int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Dumped %d flatpages.\n" % count)
@@ -0,0 +1,37 @@
+import multiprocessing
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from flatpages_plus.export import export
+
+
+class Command(BaseCommand):
+    args = '<output_dir>'
+    option_list = BaseCommand.option_list + (
+        make_option('--site', action='store', dest='site', type='int',
+            default=None, help='The ID of the site to export. Defaults to '
+                'settings.SITE_ID.'),
+        make_option('--processes', action='store', dest='processes', 
+            type='int', default=multiprocessing.cpu_count(),
+            help='How many processes to render pages with.'),
+        make_option('--batch-size', action='store', dest='batch_size', 
+            type='int', default=100, 
+            help='How many pages each process renders at a time.'),
+        make_option('--force', action='store_true', dest='force', 
+            default=False, help='Render every page, even unchanged ones.'),
+    )
+    help = ("Renders the published flatpages on a site to static HTML files, "
+            "only re-rendering pages that changed since the last export.")
+    
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: export_flatpages %s" % self.args)
+        site_id = options['site'] or settings.SITE_ID
+        written, removed = export(args[0], site_id, 
+            processes=options['processes'], batch_size=options['batch_size'], 
+            force=options['force'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Wrote %d flatpages and removed %d.\n" % 
+                              (written, removed))
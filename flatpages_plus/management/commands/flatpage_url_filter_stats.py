@@ -0,0 +1,16 @@
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.urlfilter import url_filter
+
+
+class Command(NoArgsCommand):
+    help = "Shows the size and false positive rate of the flatpage URL filter."
+    
+    def handle_noargs(self, **options):
+        stats = url_filter.stats()
+        self.stdout.write("URLs: %(urls)d\n"
+                          "Size: %(bytes)d bytes (%(bits)d bits, %(hashes)d hashes)\n"
+                          "Expected false positive rate: %(false_positive_rate).4f\n" 
+                          "Let through: %(hits)d\n"
+                          "Rejected: %(rejections)d\n"
+                          % stats)
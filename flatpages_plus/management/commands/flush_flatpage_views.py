@@ -0,0 +1,12 @@
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.counters import flush_views
+
+
+class Command(NoArgsCommand):
+    help = "Writes buffered flatpage view counts to the database."
+    
+    def handle_noargs(self, **options):
+        views = flush_views()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Flushed %d flatpage views.\n" % views)
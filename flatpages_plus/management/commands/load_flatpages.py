@@ -0,0 +1,49 @@
+import sys
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flatpages_plus.bulk import Loader
+
+
+class Command(BaseCommand):
+    args = '[input_file]'
+    option_list = BaseCommand.option_list + (
+        make_option('--site', action='store', dest='site', type='int',
+            default=None, help='The ID of the site to load pages into. '
+                'Defaults to settings.SITE_ID.'),
+        make_option('--batch-size', action='store', dest='batch_size', 
+            type='int', default=500, 
+            help='How many pages to write to the database at a time '
+                '(at most 500).'),
+        make_option('--no-update', action='store_false', dest='update', 
+            default=True, help="Skip pages whose URL already exists on the "
+                "site instead of updating them."),
+        make_option('--default-owner', action='store', dest='default_owner',
+            type='int', default=1, help="The ID of the user that owns pages "
+                "whose owner isn't found."),
+        make_option('--keep-dates', action='store_true', dest='keep_dates',
+            default=False, help="Copy the pages' created and modified times "
+                "from the file (slower)."),
+    )
+    help = ("Loads flatpages from a JSON Lines file (or standard input) as "
+            "written by dump_flatpages, updating pages with the same URL.")
+    
+    def handle(self, *args, **options):
+        site_id = options['site'] or settings.SITE_ID
+        if args:
+            lines = open(args[0])
+        else:
+            lines = sys.stdin
+        loader = Loader(site_id, batch_size=options['batch_size'], 
+            update=options['update'], default_owner=options['default_owner'],
+            keep_dates=options['keep_dates'])
+        try:
+            created, updated, skipped = loader.load(lines)
+        finally:
+            if args:
+                lines.close()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Created %d, updated %d and skipped %d "
+                              "flatpages.\n" % (created, updated, skipped))
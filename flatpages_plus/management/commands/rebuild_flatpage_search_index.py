@@ -0,0 +1,18 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.search import rebuild_index
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size', 
+            type='int', default=200, help='How many pages to index at a time.'),
+    )
+    help = "Rebuilds the flatpage search index from scratch."
+    
+    def handle_noargs(self, **options):
+        pages = rebuild_index(batch_size=options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Indexed %d flatpages.\n" % pages)
@@ -0,0 +1,15 @@
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.caching import bump_generation
+from flatpages_plus.models import FlatPage
+from flatpages_plus.utils import rebuild_tree
+
+
+class Command(NoArgsCommand):
+    help = "Recalculates the parent and depth of every flatpage."
+    
+    def handle_noargs(self, **options):
+        pages = rebuild_tree(FlatPage)
+        bump_generation()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Rebuilt the tree for %d flatpages.\n" % pages)
@@ -0,0 +1,13 @@
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.related import rebuild_related
+
+
+class Command(NoArgsCommand):
+    help = "Rescores the related pages of every flatpage from their tags."
+    
+    def handle_noargs(self, **options):
+        pages = rebuild_related()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Rescored the related pages of %d flatpages.\n"
+                              % pages)
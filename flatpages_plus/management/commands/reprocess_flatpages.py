@@ -0,0 +1,26 @@
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from flatpages_plus.processors import reprocess
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', action='store', dest='processes', 
+            type='int', default=multiprocessing.cpu_count(),
+            help='How many processes to process pages with.'),
+        make_option('--batch-size', action='store', dest='batch_size', 
+            type='int', default=200, 
+            help='How many pages each process handles at a time.'),
+    )
+    help = ("Runs every flatpage's content through the content processors "
+            "again, for example after FLATPAGES_PLUS_CONTENT_PROCESSORS "
+            "changes.")
+    
+    def handle_noargs(self, **options):
+        count = reprocess(processes=options['processes'], 
+                          batch_size=options['batch_size'])
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write("Processed %d flatpages.\n" % count)
@@ -1,7 +1,52 @@
 import datetime
+import random
 
 from django.conf import settings
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connections, models
+from django.db.models.query import QuerySet
+from taggit.models import TaggedItem
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation, make_key
+
+
+class EstimatedCountQuerySet(QuerySet):
+    """
+    A QuerySet that uses the database's estimate of the table size, rather
+    than counting every row, when it isn't filtered and the table is large.
+    """
+    
+    def estimated_count(self):
+        """
+        Return the database's row estimate for the table, or None if the 
+        database can't give one.
+        """
+        connection = connections[self.db]
+        table = self.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+        elif connection.vendor == 'mysql':
+            sql = ('SELECT table_rows FROM information_schema.tables '
+                   'WHERE table_schema = DATABASE() AND table_name = %s')
+        else:
+            return None
+        cursor = connection.cursor()
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return int(row[0])
+    
+    def count(self):
+        if self._result_cache is None and not self.query.where and \
+                not self.query.low_mark and self.query.high_mark is None:
+            estimate = self.estimated_count()
+            if estimate is not None and \
+                    estimate > app_settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super(EstimatedCountQuerySet, self).count()
 
 
 class FlatpagesManager(models.Manager):
@@ -9,12 +54,20 @@ class FlatpagesManager(models.Manager):
     Allows flatpages to be listed and sorted by various criteria.
     """
     
+    def get_estimated_count_query_set(self):
+        """
+        Return all the flatpages in a QuerySet whose unfiltered ``count()`` 
+        is the database's estimate once there are a lot of pages.
+        """
+        return EstimatedCountQuerySet(self.model, using=self._db)
+    
     # def published(self):
     #     """Get only published"""
     #     pass
     
     def get_flatpages(self, sort='modified', tags=None, not_tags=None, starts_with=None, 
-                    owners=None, limit=None, remove=None):
+                    owners=None, limit=None, remove=None, all_tags=None, 
+                    fields=None):
         """
         The main function to return flatpages based on various criteria.
         
@@ -35,6 +88,9 @@ class FlatpagesManager(models.Manager):
         tags='foo,bar,baz'          Returns all flatpages tagged with _either_      
                                     'foo', 'bar', or 'baz'. Optional.
         
+        all_tags='foo,bar'          Returns only flatpages tagged with _both_
+                                    'foo' and 'bar'. Optional.
+        
         not_tags='foo,bar'          Removes any flatpages tagged with 'foo' or
                                     'bar' from the QuerySet.
                                     
@@ -54,33 +110,74 @@ class FlatpagesManager(models.Manager):
                                     (e.g. '1,5,6,8,234') or an integer 
                                     (e.g. 1). Optional.
         
+        fields='url,name,title'     Only load the given fields (the ID is 
+                                    always loaded), so listings don't fetch 
+                                    the content of every page. Can be a 
+                                    string or a list. Optional.
+        
         """
         # Get the initial queryset
         query_set = self.get_query_set()
         
+        # Only load the columns the caller needs.
+        if fields:
+            if isinstance(fields, basestring):
+                fields = str(fields).split(',')
+            fields = [field.strip() for field in fields]
+            query_set = query_set.only(*fields)
+        
         # Filter by the current site.
         query_set = query_set.filter(sites__id=settings.SITE_ID)
-        
-        # Get all the filtering sort types.
-        sort_types = {
-            'modified': query_set.order_by('modified'),
-            '-modified': query_set.order_by('-modified'),
-            'created': query_set.order_by('created'),
-            '-created': query_set.order_by('-created'),
-            'views': query_set.order_by('-views'),
-            '-views': query_set.order_by('views'),
-            'random': query_set.order_by('?')
-        }
-        
-        query_set = sort_types.get(sort, query_set)
             
+        # Tag filters are worked out with set operations on the tag index and
+        # the result is passed as at most one bounded ``pk__in`` list (SQLite
+        # allows 999 parameters per query). Larger results are filtered with
+        # subqueries on the tag table instead of joins.
+        include_ids = None
+        exclude_ids = None
+        include_tags = []
+        exclude_tags = []
+        
         if tags:
             tag_list = str(tags).split(',')
-            query_set = query_set.filter(tags__name__in=tag_list).distinct()
+            include_tags.append(tag_list)
+            page_ids = self._tagged_page_ids(tag_list)
+            if page_ids is not None:
+                include_ids = set(page_ids)
+        
+        if all_tags:
+            all_tags_list = str(all_tags).split(',')
+            include_tags.extend([[tag] for tag in all_tags_list])
+            page_ids = self._tagged_page_ids(all_tags_list, match_all=True)
+            if page_ids is not None:
+                if include_ids is None:
+                    include_ids = set(page_ids)
+                else:
+                    include_ids &= set(page_ids)
         
         if not_tags:
             not_tags_list = str(not_tags).split(',')
-            query_set = query_set.exclude(tags__name__in=not_tags_list)
+            exclude_tags.append(not_tags_list)
+            page_ids = self._tagged_page_ids(not_tags_list)
+            if page_ids is not None:
+                exclude_ids = set(page_ids)
+        
+        max_ids = app_settings.TAG_INDEX_MAX_IDS
+        if include_ids is not None:
+            include_ids -= exclude_ids or set()
+        if include_ids is not None and len(include_ids) <= max_ids:
+            query_set = query_set.filter(pk__in=list(include_ids))
+        else:
+            for tag_list in include_tags:
+                query_set = query_set.filter(pk__in=self._tagged_subquery(
+                    tag_list))
+            if exclude_ids is not None and len(exclude_ids) <= max_ids:
+                if exclude_ids:
+                    query_set = query_set.exclude(pk__in=list(exclude_ids))
+            else:
+                for tag_list in exclude_tags:
+                    query_set = query_set.exclude(pk__in=self._tagged_subquery(
+                        tag_list))
         
         if starts_with:
             starts_with = str(starts_with)
@@ -88,32 +185,116 @@ class FlatpagesManager(models.Manager):
         
         if owners:
             owners_list = str(owners).split(',')
-            query_set = query_set.filter(owner__pk__in=owner_list)
-            
+            query_set = query_set.filter(owner__pk__in=owners_list)
+        
+        remove_list = []
         if remove:
             remove_list = str(remove).split(',')
+        
+        # Pick random pages from a cached list of IDs rather than making the 
+        # database shuffle the whole table.
+        if sort == 'random' and limit:
+            key = make_key('random', get_generation(), settings.SITE_ID, 
+                           tags, all_tags, not_tags, starts_with, owners)
+            return self._random_sample(query_set, key, int(limit), remove_list,
+                                       fields)
+            
+        if remove_list:
             query_set = query_set.exclude(pk__in=remove_list)
+        
+        # Get all the filtering sort types.
+        sort_types = {
+            'modified': 'modified',
+            '-modified': '-modified',
+            'created': 'created',
+            '-created': '-created',
+            'views': '-views',
+            '-views': 'views',
+            'random': '?',
+        }
+        
+        if sort in sort_types:
+            query_set = query_set.order_by(sort_types[sort])
             
         # Limit the length of the result.
         if limit:
             query_set = query_set[:int(limit)]
             
         return query_set
+    
+    def search(self, query, limit=20):
+        """
+        Search the published flatpages on the current site for pages 
+        containing every word in ``query``. Returns a list of pages, best 
+        matches first, each with a ``search_score`` attribute.
+        """
+        from flatpages_plus.search import search
+        queryset = self.get_query_set().filter(sites__id=settings.SITE_ID, 
+                                               status='p')
+        return search(query, queryset, limit=limit)
+    
+    def related_to(self, page, limit=None):
+        """
+        Return the published pages on the current site that are most related
+        to ``page`` by their tags, best first, from the precomputed related 
+        pages table.
+        """
+        query_set = self.get_query_set().filter(related_page_of__page=page,
+            sites__id=settings.SITE_ID, status='p').order_by(
+            '-related_page_of__score')
+        if limit:
+            query_set = query_set[:int(limit)]
+        return query_set
+    
+    def _tagged_page_ids(self, tag_list, match_all=False):
+        """
+        Look up the IDs of the pages with any (or all) of the given tags in 
+        the in-memory tag index.
         
+        Returns None if the index is turned off, in which case the caller 
+        should filter through the tag table instead.
+        """
+        if not app_settings.TAG_INDEX:
+            return None
+        from flatpages_plus.tagindex import tag_index
+        if match_all:
+            return tag_index.pages_with_all(tag_list)
+        return tag_index.pages_with_any(tag_list)
+    
+    def _tagged_subquery(self, tag_list):
+        """
+        Return a subquery for the IDs of the pages with any of the given 
+        tags, for filtering with ``pk__in`` without joining the tag tables
+        (and needing ``distinct()``) in the outer query.
+        """
+        content_type = ContentType.objects.get_for_model(self.model)
+        return TaggedItem.objects.filter(content_type=content_type, 
+            tag__name__in=tag_list).values('object_id')
+    
+    def _random_sample(self, query_set, key, limit, remove_list, fields=None):
+        """
+        Return up to ``limit`` random pages from ``query_set``, in random 
+        order.
         
-        
-        
-        # Try to get the type of sorting the user wants. Default to most
-        # recently modified.
-        # try:
-        #     query_set = sort_types.get(sort, query_set)
-        # except Exception, e:
-        #     raise e
-        
-        
-        
-        
-        
+        The IDs of the pages matching the filters are cached until any 
+        flatpage changes, so after the first call this only fetches the 
+        pages that were picked. Removed pages are left out of the cache key 
+        so that every page listing "other pages" can share the same list.
+        """
+        page_ids = cache.get(key)
+        if page_ids is None:
+            page_ids = list(query_set.order_by().values_list('pk', flat=True))
+            cache.set(key, page_ids, app_settings.CACHE_TIMEOUT)
+        if remove_list:
+            remove_list = set([int(pk) for pk in remove_list])
+            page_ids = [pk for pk in page_ids if pk not in remove_list]
+        sample = random.sample(page_ids, min(limit, len(page_ids)))
+        # Shuffling a handful of rows is cheap, and keeps the result a 
+        # QuerySet like every other sort.
+        query_set = self.get_query_set().filter(pk__in=sample).order_by('?')
+        if fields:
+            query_set = query_set.only(*fields)
+        return query_set
     
     def most_recently_modified(self, limit=None):
         """
@@ -1,6 +1,10 @@
+from __future__ import with_statement
+
 from django.conf import settings
 from django.http import Http404
 
+from flatpages_plus import app_settings, instrumentation
+from flatpages_plus.urlfilter import url_filter
 from flatpages_plus.views import flatpage
 
 
@@ -8,6 +12,26 @@ class FlatpageFallbackMiddleware(object):
     def process_response(self, request, response):
         if response.status_code != 404:
             return response # No need to check for a flatpage for non-404 responses.
+        if not app_settings.INSTRUMENTATION:
+            return self.fallback(request, response)
+        timings = instrumentation.start(request)
+        try:
+            response = self.fallback(request, response)
+        finally:
+            instrumentation.finish(timings, response)
+        return response
+    
+    def fallback(self, request, response):
+        """
+        Return the flatpage at the response's URL, or the original response
+        if there isn't one.
+        """
+        if app_settings.URL_FILTER:
+            with instrumentation.phase('url_filter'):
+                might_be_flatpage = self.might_be_flatpage(request.path_info)
+            if not might_be_flatpage:
+                instrumentation.note('url_filter', 'rejected')
+                return response # Definitely not a flatpage, skip the database.
         try:
             return flatpage(request, request.path_info)
         # Return the original response if any errors happened. Because this
@@ -18,3 +42,16 @@ class FlatpageFallbackMiddleware(object):
             if settings.DEBUG:
                 raise
             return response
+    
+    def might_be_flatpage(self, url):
+        """
+        Check the URL against the in-memory filter of flatpage URLs, the same
+        way the flatpage view will normalize it.
+        """
+        if not url.startswith('/'):
+            url = "/" + url
+        if not url.endswith('/') and settings.APPEND_SLASH:
+            # The view redirects to the URL with a slash, so only do that if
+            # there might be a page there.
+            url = "%s/" % url
+        return url_filter.might_exist(url)
@@ -3,11 +3,14 @@ from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.db import models
 from django.db.models import permalink
+from django.utils import simplejson
 from django.utils.translation import ugettext_lazy as _
 
 from taggit.managers import TaggableManager
 
 from flatpages_plus.managers import FlatpagesManager
+from flatpages_plus.processors import process
+from flatpages_plus.utils import find_parent_id, get_ancestor_urls, get_url_depth
 
 
 class FlatPage(models.Model):
@@ -25,10 +28,16 @@ class FlatPage(models.Model):
         help_text=_('The name of the page is used in creating links to \
         pages and the breadcrumbs.'))
     content = models.TextField(_('content'), blank=True)
+    rendered_content = models.TextField(_('rendered content'), blank=True,
+        editable=False, help_text=_('The content after it has been through \
+        the content processors. This is kept up to date automatically.'))
+    toc = models.TextField(_('table of contents'), blank=True, editable=False,
+        help_text=_('The headings in the content, as JSON.'))
+    excerpt = models.TextField(_('excerpt'), blank=True, editable=False)
     owner = models.ForeignKey(User, verbose_name=_('owner'), default=1,
         help_text=_('The user that is responsible for this page.'))
     views = models.IntegerField(_('views'), default=0, blank=True, null=True, 
-        help_text=_('The number of the times the page has been viewed \
+        db_index=True, help_text=_('The number of the times the page has been viewed \
         (other than the owner).'), )
     status = models.CharField(_('status'), max_length=1, choices=STATUS_LEVELS, 
         default='d', help_text=_('Whether or not the page is visible on the site'))
@@ -42,10 +51,17 @@ class FlatPage(models.Model):
         help_text=_("If this is checked, only logged-in users will be able \
         to view the page."))
     sites = models.ManyToManyField(Site, default=[settings.SITE_ID])
+    parent = models.ForeignKey('self', verbose_name=_('parent'), null=True,
+        blank=True, editable=False, related_name='children', 
+        on_delete=models.SET_NULL, help_text=_('The closest page above this \
+        one in the URL hierarchy. This is kept up to date automatically.'))
+    depth = models.PositiveIntegerField(_('depth'), default=0, editable=False,
+        db_index=True, help_text=_('How many levels below the root the \
+        page\'s URL is.'))
     created = models.DateTimeField(_('created'), auto_now_add=True, 
-        blank=True, null=True)
+        blank=True, null=True, db_index=True)
     modified = models.DateTimeField(_('modified'), auto_now=True, 
-        blank=True, null=True)
+        blank=True, null=True, db_index=True)
     
     objects = FlatpagesManager()
     
@@ -65,3 +81,184 @@ class FlatPage(models.Model):
     
     def get_absolute_url(self): 
         return '%s' % self.url
+    
+    def save(self, *args, **kwargs):
+        # Views are counted with views = views + n, which leaves NULL alone.
+        if self.views is None:
+            self.views = 0
+        self.depth = get_url_depth(self.url)
+        self.parent_id = self.find_parent_id()
+        self.process_content()
+        super(FlatPage, self).save(*args, **kwargs)
+        self.update_tree()
+    
+    def process_content(self):
+        """
+        Run the content through the content processors and store the 
+        results on the page (without saving it).
+        """
+        processed = process(self)
+        self.rendered_content = processed.html
+        self.toc = processed.toc and simplejson.dumps(processed.toc) or ''
+        self.excerpt = processed.excerpt
+    
+    def get_processed_fields(self):
+        """
+        Return the fields set by ``process_content()``, for use with 
+        ``update()``.
+        """
+        return {
+            'rendered_content': self.rendered_content,
+            'toc': self.toc,
+            'excerpt': self.excerpt,
+        }
+    
+    def get_toc(self):
+        """
+        Return the table of contents as a list of ``{'level': ..., 
+        'anchor': ..., 'title': ...}`` dictionaries.
+        """
+        if not self.toc:
+            return []
+        return simplejson.loads(self.toc)
+    
+    def get_site_ids(self):
+        if not self.pk:
+            return []
+        return list(self.sites.values_list('pk', flat=True))
+    
+    def find_parent_id(self):
+        """
+        Look up the closest existing page above this one, on one of the same
+        sites, with one query.
+        """
+        ancestor_urls = get_ancestor_urls(self.url)[:-1]
+        site_ids = self.get_site_ids()
+        if not ancestor_urls or not site_ids:
+            return None
+        pages = FlatPage.objects.filter(url__in=ancestor_urls, 
+            sites__in=site_ids).exclude(pk=self.pk)
+        return find_parent_id(self.url, dict([(url, pk) for pk, url in 
+                                               pages.values_list('pk', 'url')]))
+    
+    def update_parent(self):
+        """
+        Find the page's parent again, and fix the pages around it, after its
+        sites change.
+        """
+        self.parent_id = self.find_parent_id()
+        FlatPage.objects.filter(pk=self.pk).update(parent=self.parent_id)
+        self.update_tree()
+    
+    def update_tree(self):
+        """
+        Fix the parents of the pages affected by this page being added, moved
+        or removed, or its sites changing.
+        """
+        site_ids = self.get_site_ids()
+        # Pages below this one, on the same sites, whose closest page used to
+        # be further up.
+        if site_ids:
+            FlatPage.objects.filter(url__startswith=self.url, 
+                depth__gt=self.depth, sites__in=site_ids
+                ).exclude(parent__url__startswith=self.url).exclude(pk=self.pk
+                ).update(parent=self)
+        # Pages that were below this one before it moved, or that no longer
+        # share a site with it.
+        stale = set(self.children.exclude(url__startswith=self.url
+                                          ).values_list('pk', flat=True))
+        stale.update(self.children.exclude(sites__in=site_ids
+                                           ).values_list('pk', flat=True))
+        for page in FlatPage.objects.filter(pk__in=list(stale)):
+            FlatPage.objects.filter(pk=page.pk).update(
+                parent=page.find_parent_id())
+    
+    def get_ancestors(self):
+        """
+        Return the pages above this one on the same sites, from the root 
+        down, in one query.
+        """
+        return FlatPage.objects.filter(
+            url__in=get_ancestor_urls(self.url)[:-1], 
+            sites__in=self.get_site_ids()).distinct().order_by('depth')
+    
+    def get_children(self):
+        """Return the pages directly below this one."""
+        return self.children.all()
+    
+    def get_descendants(self, include_self=False):
+        """
+        Return all the pages below this one on the same sites in one query.
+        """
+        pages = FlatPage.objects.filter(url__startswith=self.url,
+            sites__in=self.get_site_ids()).distinct()
+        if not include_self:
+            pages = pages.filter(depth__gt=self.depth)
+        return pages
+
+
+
+class SearchTerm(models.Model):
+    """
+    An entry in the full text search index: how strongly a word is 
+    associated with a page.
+    """
+    term = models.CharField(_('term'), max_length=50)
+    page = models.ForeignKey(FlatPage, verbose_name=_('page'), 
+        related_name='search_terms')
+    weight = models.PositiveIntegerField(_('weight'), default=1)
+    
+    class Meta:
+        verbose_name = _('search term')
+        verbose_name_plural = _('search terms')
+        unique_together = (('term', 'page'),)
+    
+    def __unicode__(self):
+        return u"%s -- %s" % (self.term, self.page_id)
+
+
+
+class RelatedPage(models.Model):
+    """
+    A precomputed link between a page and one of the pages most similar to 
+    it, scored by how much their tags overlap.
+    """
+    page = models.ForeignKey(FlatPage, verbose_name=_('page'), 
+        related_name='related_pages')
+    related = models.ForeignKey(FlatPage, verbose_name=_('related page'),
+        related_name='related_page_of')
+    score = models.FloatField(_('score'))
+    
+    class Meta:
+        verbose_name = _('related page')
+        verbose_name_plural = _('related pages')
+        ordering = ('-score',)
+        unique_together = (('page', 'related'),)
+    
+    def __unicode__(self):
+        return u"%s -> %s (%.2f)" % (self.page_id, self.related_id, self.score)
+
+
+
+class FlatPageRoute(models.Model):
+    """
+    Which page is at a URL on a site, so pages can be looked up with a single
+    unique index probe instead of a join against their sites. This is kept 
+    up to date automatically.
+    """
+    site = models.ForeignKey(Site, verbose_name=_('site'))
+    url = models.CharField(_('URL'), max_length=150)
+    page = models.ForeignKey(FlatPage, verbose_name=_('page'), 
+        related_name='routes')
+    
+    class Meta:
+        verbose_name = _('flat page route')
+        verbose_name_plural = _('flat page routes')
+        unique_together = (('site', 'url'),)
+    
+    def __unicode__(self):
+        return u"%s%s -> %s" % (self.site_id, self.url, self.page_id)
+
+
+# Connect the signal handlers that keep the caches up to date.
+from flatpages_plus import signals
@@ -0,0 +1,151 @@
+"""
+The content pipeline, which processes a page's content once, when it's 
+saved, rather than in the template on every request.
+
+A processor is a function that takes a ``ProcessedContent`` and changes its
+``html``, ``toc`` or ``excerpt`` in place. The processors listed in 
+``FLATPAGES_PLUS_CONTENT_PROCESSORS`` are run in order, and the results are
+stored in the page's ``rendered_content``, ``toc`` and ``excerpt`` fields.
+"""
+import re
+
+from django.db import connection
+from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode
+from django.utils.html import strip_tags
+from django.utils.importlib import import_module
+from django.utils.text import truncate_words
+
+from flatpages_plus import app_settings
+
+HEADING_RE = re.compile(r'<h([1-6])([^>]*)>(.*?)</h\1>', re.I | re.S)
+ID_RE = re.compile(r'\bid\s*=\s*["\']([^"\']*)["\']', re.I)
+PARAGRAPH_RE = re.compile(r'<p[^>]*>(.*?)</p>', re.I | re.S)
+
+_processors = None
+
+
+class ProcessedContent(object):
+    """
+    A page's content on its way through the pipeline.
+    
+    ``toc`` is a list of ``{'level': ..., 'anchor': ..., 'title': ...}`` 
+    dictionaries, one for each heading.
+    """
+    
+    def __init__(self, page):
+        self.page = page
+        self.html = force_unicode(page.content or '')
+        self.toc = []
+        self.excerpt = u''
+
+
+def heading_anchors(content):
+    """
+    Give every heading an ``id`` (keeping any it already has) and list the 
+    headings in the table of contents.
+    """
+    used = set()
+    
+    def add_anchor(match):
+        level, attrs, title = match.groups()
+        existing = ID_RE.search(attrs)
+        if existing:
+            anchor = existing.group(1)
+        else:
+            base = slugify(strip_tags(title)) or 'section'
+            anchor, n = base, 1
+            while anchor in used:
+                n += 1
+                anchor = '%s-%d' % (base, n)
+            attrs = ' id="%s"%s' % (anchor, attrs)
+        used.add(anchor)
+        content.toc.append({'level': int(level), 'anchor': anchor, 
+                            'title': strip_tags(title).strip()})
+        return '<h%s%s>%s</h%s>' % (level, attrs, title, level)
+    
+    content.html = HEADING_RE.sub(add_anchor, content.html)
+
+def excerpt(content):
+    """
+    Use the start of the first paragraph (or of the page, if it has no 
+    paragraphs) as the excerpt.
+    """
+    match = PARAGRAPH_RE.search(content.html)
+    text = strip_tags(match and match.group(1) or content.html)
+    content.excerpt = truncate_words(' '.join(text.split()), 
+                                     app_settings.EXCERPT_WORDS)
+
+def markdown_to_html(content):
+    """
+    Convert the content from Markdown to HTML. Needs the ``markdown`` 
+    package, and should come before the other processors.
+    """
+    from markdown import markdown
+    content.html = markdown(content.html)
+
+def get_processors():
+    global _processors
+    if _processors is None:
+        processors = []
+        for path in app_settings.CONTENT_PROCESSORS:
+            module, attr = path.rsplit('.', 1)
+            processors.append(getattr(import_module(module), attr))
+        _processors = processors
+    return _processors
+
+def process(page):
+    """
+    Run a page's content through the pipeline and return the 
+    ``ProcessedContent``.
+    """
+    content = ProcessedContent(page)
+    for processor in get_processors():
+        processor(content)
+    return content
+
+def reprocess_pages(page_ids):
+    """
+    Run a batch of pages through the pipeline again and store the results
+    with ``update()``, so the pages' ``modified`` times are left alone.
+    """
+    from flatpages_plus.models import FlatPage
+    pages = FlatPage.objects.filter(pk__in=page_ids)
+    for page in pages:
+        page.process_content()
+        FlatPage.objects.filter(pk=page.pk).update(
+            **page.get_processed_fields())
+    return len(page_ids)
+
+def reprocess(processes=1, batch_size=200):
+    """
+    Run every page through the pipeline again, in batches spread over 
+    ``processes`` worker processes. Returns the number of pages processed.
+    """
+    from flatpages_plus.caching import bump_generation
+    from flatpages_plus.lookup import clear_lookup_cache
+    from flatpages_plus.models import FlatPage
+    from flatpages_plus.purging import purge_all
+    page_ids = list(FlatPage.objects.values_list('pk', flat=True))
+    batches = [page_ids[start:start + batch_size] 
+               for start in range(0, len(page_ids), batch_size)]
+    
+    if processes > 1 and len(batches) > 1:
+        from multiprocessing import Pool
+        # Each worker needs its own database connection.
+        connection.close()
+        pool = Pool(processes)
+        try:
+            pool.map(reprocess_pages, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for batch in batches:
+            reprocess_pages(batch)
+    
+    # update() doesn't send signals, so invalidate the caches ourselves.
+    bump_generation()
+    clear_lookup_cache()
+    purge_all()
+    return len(page_ids)
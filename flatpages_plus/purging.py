@@ -0,0 +1,237 @@
+"""
+Surrogate keys and purging for caching proxies in front of the flatpages.
+
+Each response is tagged (in the ``Surrogate-Key`` header by default) with:
+
+* ``flatpages``: every flatpage.
+* ``page-<id>``: the page itself.
+* ``tag-<slug>``: each of the page's tags.
+* ``url-<url>``: the page's URL and each URL above it, so a whole section 
+  of the site can be purged at once.
+
+When pages change, the keys of the affected responses are queued and sent 
+to the purger selected by ``FLATPAGES_PLUS_PURGE_BACKEND`` in batches, at the
+end of the request or once ``FLATPAGES_PLUS_PURGE_BATCH_SIZE`` keys are 
+waiting.
+"""
+import atexit
+import httplib
+import threading
+import urllib2
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.utils.http import urlquote
+from django.utils.importlib import import_module
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation, make_key
+from flatpages_plus.utils import get_ancestor_urls
+
+ALL_PAGES_KEY = 'flatpages'
+
+
+def page_key(page_id):
+    return 'page-%s' % page_id
+
+def tag_key(slug):
+    return 'tag-%s' % slug
+
+def url_key(url):
+    return 'url-%s' % urlquote(url)
+
+def get_tag_slugs(page):
+    """
+    Return the slugs of a page's tags, cached until the flatpages change.
+    """
+    key = make_key('tag_slugs', page.pk, get_generation())
+    slugs = cache.get(key)
+    if slugs is None:
+        slugs = list(page.tags.values_list('slug', flat=True))
+        cache.set(key, slugs, app_settings.CACHE_TIMEOUT)
+    return slugs
+
+def get_surrogate_keys(page):
+    """Return the surrogate keys of a page's responses."""
+    keys = [ALL_PAGES_KEY, page_key(page.pk)]
+    keys.extend([tag_key(slug) for slug in get_tag_slugs(page)])
+    keys.extend([url_key(url) for url in get_ancestor_urls(page.url)])
+    return keys
+
+def set_cache_headers(response, page, cacheable):
+    """
+    Add the ``Cache-Control`` and surrogate key headers to a flatpage 
+    response.
+    """
+    if app_settings.CACHE_CONTROL:
+        response['Cache-Control'] = (cacheable and app_settings.CACHE_CONTROL
+                                     or 'private')
+    if app_settings.SURROGATE_KEYS and cacheable:
+        response[app_settings.SURROGATE_KEY_HEADER] = ' '.join(
+            get_surrogate_keys(page))
+
+
+class BasePurger(object):
+    """
+    The interface every purger has to provide.
+    """
+    
+    def purge(self, keys):
+        """Purge every response tagged with any of the surrogate ``keys``."""
+        raise NotImplementedError
+
+
+class NullPurger(BasePurger):
+    """
+    Doesn't purge anything.
+    """
+    
+    def purge(self, keys):
+        pass
+
+
+class HTTPPurger(BasePurger):
+    """
+    Sends each batch of keys to ``FLATPAGES_PLUS_PURGE_URL`` as a single 
+    request, with the keys in the surrogate key header.
+    
+    Failed purges are dropped rather than breaking the request that changed
+    the page; the cached copies expire on their own.
+    """
+    
+    def __init__(self, url=None, method=None, timeout=None):
+        self.url = url or app_settings.PURGE_URL
+        self.method = method or app_settings.PURGE_METHOD
+        self.timeout = timeout or app_settings.PURGE_TIMEOUT
+    
+    def purge(self, keys):
+        request = urllib2.Request(self.url, data='', headers={
+            app_settings.SURROGATE_KEY_HEADER: ' '.join(keys)})
+        method = self.method
+        request.get_method = lambda: method
+        try:
+            urllib2.urlopen(request, timeout=self.timeout).close()
+        except (urllib2.URLError, httplib.HTTPException, IOError):
+            pass
+
+
+PURGERS = {
+    'null': NullPurger,
+    'http': HTTPPurger,
+}
+
+_purger = None
+
+def get_purger():
+    """
+    Return the purger selected by ``FLATPAGES_PLUS_PURGE_BACKEND``.
+    """
+    global _purger
+    if _purger is None:
+        name = app_settings.PURGE_BACKEND
+        if name in PURGERS:
+            purger_class = PURGERS[name]
+        else:
+            module, attr = name.rsplit('.', 1)
+            purger_class = getattr(import_module(module), attr)
+        _purger = purger_class()
+    return _purger
+
+
+class PurgeQueue(object):
+    """
+    Collects the surrogate keys to purge, without duplicates, and sends them
+    to ``purger`` (the configured purger by default) in batches of 
+    ``batch_size``.
+    """
+    
+    def __init__(self, batch_size=None, purger=None):
+        if batch_size is None:
+            batch_size = app_settings.PURGE_BATCH_SIZE
+        self.batch_size = batch_size
+        self.purger = purger
+        self._keys = set()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def add(self, keys):
+        self._lock.acquire()
+        try:
+            self._keys.update(keys)
+            due = len(self._keys) >= self.batch_size
+        finally:
+            self._lock.release()
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """Send every queued key to the purger and return how many."""
+        self._lock.acquire()
+        try:
+            keys, self._keys = sorted(self._keys), set()
+        finally:
+            self._lock.release()
+        if not keys:
+            return 0
+        purger = self.purger or get_purger()
+        for start in range(0, len(keys), self.batch_size):
+            purger.purge(keys[start:start + self.batch_size])
+        return len(keys)
+
+
+purge_queue = PurgeQueue()
+
+def purging_enabled():
+    return not isinstance(get_purger(), NullPurger)
+
+def purge(keys):
+    """Queue surrogate keys to be purged."""
+    if purging_enabled():
+        purge_queue.add(keys)
+
+def remember_url(page):
+    """
+    Note the URL a page had before it's saved, so if it moves, the pages 
+    cached under its old URL are purged too.
+    """
+    if page.pk and purging_enabled():
+        from flatpages_plus.models import FlatPage
+        page._purge_old_url = list(FlatPage.objects.filter(
+            pk=page.pk).values_list('url', flat=True))
+
+def purge_page(page):
+    """
+    Queue a purge of a page and of the pages below it, whose breadcrumbs 
+    show it, at its current URL and the one it had before it was saved.
+    """
+    keys = [page_key(page.pk), url_key(page.url)]
+    for old_url in getattr(page, '_purge_old_url', None) or []:
+        if old_url != page.url:
+            keys.append(url_key(old_url))
+    purge(keys)
+
+def purge_pages(page_ids):
+    """Queue a purge of the pages with the given IDs."""
+    purge([page_key(page_id) for page_id in page_ids])
+
+def purge_tag(tag, page_id=None):
+    """
+    Queue a purge of the pages with a tag (and of the page that gained or 
+    lost it, which no longer has the tag's key).
+    """
+    if purging_enabled():
+        keys = [tag_key(tag.slug)]
+        if page_id is not None:
+            keys.append(page_key(page_id))
+        purge(keys)
+
+def purge_all():
+    """Queue a purge of every flatpage."""
+    purge([ALL_PAGES_KEY])
+
+def flush_purges(**kwargs):
+    """Send any queued purges."""
+    return purge_queue.flush()
+
+request_finished.connect(flush_purges, 
+    dispatch_uid='flatpages_plus.flush_purges')
@@ -0,0 +1,227 @@
+"""
+Precomputed related pages.
+
+Two pages are scored by the Jaccard similarity of their tags (the number of 
+tags they share divided by the number of tags either of them has), and the
+best ``FLATPAGES_PLUS_RELATED_PAGES_LIMIT`` matches for each page are stored
+in the ``RelatedPage`` table. When pages are tagged or untagged, only the 
+pages that share a tag with them are rescored, all together, when the 
+request finishes.
+
+Tags on more than ``FLATPAGES_PLUS_RELATED_PAGES_MAX_TAG_PAGES`` pages are 
+left out of the shared tags, like stop words in a search, so the work done 
+for a tag change is bounded however popular the tag is.
+"""
+import atexit
+import heapq
+import threading
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import request_finished
+from django.db.models import Count
+from taggit.models import TaggedItem
+
+from flatpages_plus import app_settings
+from flatpages_plus.models import FlatPage, RelatedPage
+from flatpages_plus.utils import bulk_insert, delete_all
+
+
+# The most IDs put in a single IN list (SQLite allows 999 parameters).
+MAX_IN_SIZE = 500
+
+_pending = threading.local()
+
+
+def get_tagged_items():
+    content_type = ContentType.objects.get_for_model(FlatPage)
+    return TaggedItem.objects.filter(content_type=content_type)
+
+def chunks(ids, size=MAX_IN_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def get_common_tags(tag_ids):
+    """
+    Return the IDs of the tags, out of ``tag_ids``, that are on too many 
+    pages to count as shared.
+    """
+    max_pages = app_settings.RELATED_PAGES_MAX_TAG_PAGES
+    if max_pages is None:
+        return set()
+    common = set()
+    items = get_tagged_items()
+    for ids in chunks(tag_ids):
+        common.update([tag_id for tag_id, count in items.filter(tag__in=ids)
+            .values_list('tag').annotate(Count('id')).order_by() 
+            if count > max_pages])
+    return common
+
+def top_related(page_id, page_tag_count, shared, sizes, limit):
+    """
+    Return the ``limit`` best ``(score, related_id)`` pairs for a page, given
+    how many tags it shares with each other page and how many tags each of 
+    those pages has.
+    """
+    scores = []
+    for other_id, count in shared.items():
+        if other_id == page_id:
+            continue
+        union = page_tag_count + sizes[other_id] - count
+        scores.append((float(count) / union, -other_id))
+    return [(score, -other_id) for score, other_id in 
+            heapq.nlargest(limit, scores)]
+
+def update_related(page_ids, limit=None):
+    """
+    Rescore the related pages of the given pages together, with a handful of
+    queries however many pages there are: their tags, the pages with those 
+    tags, and how many tags each of those pages has.
+    """
+    if limit is None:
+        limit = app_settings.RELATED_PAGES_LIMIT
+    page_ids = set(page_ids)
+    if not page_ids:
+        return 0
+    items = get_tagged_items()
+    
+    page_tags = {}
+    for ids in chunks(page_ids):
+        for page_id, tag_id in items.filter(object_id__in=ids).values_list(
+                'object_id', 'tag'):
+            page_tags.setdefault(page_id, set()).add(tag_id)
+    
+    tag_pages = {}
+    tag_ids = set()
+    for tags in page_tags.values():
+        tag_ids.update(tags)
+    common = get_common_tags(tag_ids)
+    tag_ids -= common
+    for ids in chunks(tag_ids):
+        for page_id, tag_id in items.filter(tag__in=ids).values_list(
+                'object_id', 'tag'):
+            tag_pages.setdefault(tag_id, set()).add(page_id)
+    
+    # How many tags each page sharing one of those tags has in total.
+    sizes = {}
+    for ids in chunks(tag_ids):
+        sizes.update(dict(items.filter(object_id__in=items.filter(
+            tag__in=ids).values('object_id')).values_list('object_id')
+            .annotate(Count('id')).order_by()))
+    
+    existing = set()
+    candidates = set(page_ids)
+    for pages in tag_pages.values():
+        candidates.update(pages)
+    for ids in chunks(candidates):
+        existing.update(FlatPage.objects.filter(pk__in=ids).values_list('pk', 
+                                                                 flat=True))
+    
+    rows = []
+    for page_id in page_ids:
+        tags = page_tags.get(page_id)
+        if not tags or page_id not in existing:
+            continue
+        shared = {}
+        for tag_id in tags - common:
+            for other_id in tag_pages.get(tag_id, ()):
+                if other_id in existing:
+                    shared[other_id] = shared.get(other_id, 0) + 1
+        for score, related_id in top_related(page_id, len(tags), shared, 
+                                             sizes, limit):
+            rows.append(RelatedPage(page_id=page_id, related_id=related_id, 
+                                    score=score))
+    
+    for ids in chunks(page_ids):
+        RelatedPage.objects.filter(page__in=ids).delete()
+    for start in range(0, len(rows), MAX_IN_SIZE):
+        bulk_insert(RelatedPage, rows[start:start + MAX_IN_SIZE])
+    return len(page_ids)
+
+def get_affected_pages(page_ids, tag_ids=()):
+    """
+    Return the IDs of the pages whose related pages may change when pages
+    gain or lose tags: the pages themselves and every page sharing one of 
+    their tags (or one of the tags that changed), other than common tags.
+    """
+    items = get_tagged_items()
+    page_ids = set(page_ids)
+    tag_ids = set(tag_ids)
+    for ids in chunks(page_ids):
+        tag_ids.update(items.filter(object_id__in=ids).values_list('tag', 
+                                                                   flat=True))
+    affected = set(page_ids)
+    for ids in chunks(tag_ids - get_common_tags(tag_ids)):
+        affected.update(items.filter(tag__in=ids).values_list('object_id', 
+                                                              flat=True))
+    return affected
+
+def queue_related(page_ids, tag_ids=()):
+    """
+    Remember that the given pages' tags (or the given tags) changed, so 
+    their related pages are rescored together when the request finishes, 
+    rather than once for every tag added or removed.
+    """
+    if not hasattr(_pending, 'page_ids'):
+        _pending.page_ids = set()
+        _pending.tag_ids = set()
+    _pending.page_ids.update(page_ids)
+    _pending.tag_ids.update(tag_ids)
+
+def flush_related(**kwargs):
+    """
+    Rescore the related pages affected by the queued tag changes.
+    """
+    page_ids = getattr(_pending, 'page_ids', None)
+    tag_ids = getattr(_pending, 'tag_ids', None)
+    if not page_ids and not tag_ids:
+        return 0
+    _pending.page_ids = set()
+    _pending.tag_ids = set()
+    return update_related(get_affected_pages(page_ids, tag_ids))
+
+# Management commands don't finish requests.
+request_finished.connect(flush_related, 
+    dispatch_uid='flatpages_plus.flush_related')
+atexit.register(flush_related)
+
+def rebuild_related(limit=None, batch_size=500):
+    """
+    Rescore the related pages of every page, in memory, from one query of 
+    all the flatpage tags.
+    """
+    if limit is None:
+        limit = app_settings.RELATED_PAGES_LIMIT
+    page_tags = {}
+    tag_pages = {}
+    for page_id, tag_id in get_tagged_items().values_list('object_id', 'tag'):
+        page_tags.setdefault(page_id, set()).add(tag_id)
+        tag_pages.setdefault(tag_id, set()).add(page_id)
+    sizes = dict([(page_id, len(tags)) for page_id, tags in page_tags.items()])
+    max_pages = app_settings.RELATED_PAGES_MAX_TAG_PAGES
+    common = set()
+    if max_pages is not None:
+        common = set([tag_id for tag_id, pages in tag_pages.items() 
+                      if len(pages) > max_pages])
+    
+    delete_all(RelatedPage)
+    # Only keep related pages that still exist.
+    existing = set(FlatPage.objects.values_list('pk', flat=True))
+    rows = []
+    for page_id, tags in page_tags.items():
+        if page_id not in existing:
+            continue
+        shared = {}
+        for tag_id in tags - common:
+            for other_id in tag_pages[tag_id]:
+                if other_id in existing:
+                    shared[other_id] = shared.get(other_id, 0) + 1
+        for score, related_id in top_related(page_id, len(tags), shared, 
+                                             sizes, limit):
+            rows.append(RelatedPage(page_id=page_id, related_id=related_id, 
+                                    score=score))
+        if len(rows) >= batch_size:
+            bulk_insert(RelatedPage, rows)
+            rows = []
+    bulk_insert(RelatedPage, rows)
+    return len(page_tags)
@@ -0,0 +1,107 @@
+"""
+Keeps the ``FlatPageRoute`` table, which maps each ``(site, url)`` to the 
+page there, in step with the pages' URLs and sites.
+
+Where two pages claim the same URL on a site, the page that got there first
+keeps the route; ``manage.py check_flatpage_routes`` reports such conflicts.
+"""
+from django.db import IntegrityError, transaction
+
+from flatpages_plus.models import FlatPageRoute
+from flatpages_plus.utils import bulk_insert
+
+
+def sync_routes(page, site_ids=None):
+    """
+    Make a page's routes match its URL and sites, with up to three queries.
+    """
+    if site_ids is None:
+        site_ids = page.sites.values_list('pk', flat=True)
+    site_ids = set(site_ids)
+    FlatPageRoute.objects.filter(page=page).exclude(url=page.url, 
+        site__in=site_ids).delete()
+    if not site_ids:
+        return
+    taken = set(FlatPageRoute.objects.filter(url=page.url, 
+        site__in=site_ids).values_list('site', flat=True))
+    routes = [FlatPageRoute(site_id=site_id, url=page.url, page=page)
+              for site_id in site_ids - taken]
+    if not routes:
+        return
+    # Another page can take one of the URLs between the check and the insert.
+    # The savepoints keep the failed insert from breaking the transaction.
+    sid = transaction.savepoint()
+    try:
+        bulk_insert(FlatPageRoute, routes)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+        for route in routes:
+            add_route(route)
+    else:
+        transaction.savepoint_commit(sid)
+
+def add_route(route):
+    """
+    Insert a single route, unless another page already has its URL.
+    """
+    sid = transaction.savepoint()
+    try:
+        route.save(force_insert=True)
+    except IntegrityError:
+        transaction.savepoint_rollback(sid)
+    else:
+        transaction.savepoint_commit(sid)
+
+def get_expected_routes(page_model):
+    """
+    Return ``{(site_id, url): [page_id, ...]}`` for every page on every site.
+    """
+    expected = {}
+    for page_id, url, site_id in page_model.sites.through.objects.values_list(
+            'flatpage', 'flatpage__url', 'site'):
+        expected.setdefault((site_id, url), []).append(page_id)
+    return expected
+
+def check_routes(page_model, route_model):
+    """
+    Compare the routes with the pages' URLs and sites.
+    
+    Takes the model classes so it can be used from migrations. Returns the 
+    routes that should exist but don't, as ``(site_id, url, page_id)``; the
+    IDs of the routes that shouldn't exist; and ``{(site_id, url): 
+    [page_id, ...]}`` for the URLs claimed by more than one page on a site.
+    """
+    expected = get_expected_routes(page_model)
+    routes = dict([((site_id, url), (pk, page_id)) for pk, site_id, url, page_id
+        in route_model.objects.values_list('pk', 'site', 'url', 'page')])
+    missing = []
+    stale = []
+    for (site_id, url), page_ids in expected.items():
+        route = routes.get((site_id, url))
+        if route is not None and route[1] in page_ids:
+            continue
+        if route is not None:
+            stale.append(route[0])
+        missing.append((site_id, url, min(page_ids)))
+    for key, (pk, page_id) in routes.items():
+        if key not in expected:
+            stale.append(pk)
+    conflicts = dict([(key, sorted(page_ids)) for key, page_ids in 
+                      expected.items() if len(page_ids) > 1])
+    return missing, stale, conflicts
+
+def fix_routes(page_model, route_model, batch_size=500):
+    """
+    Add the missing routes and remove the stale ones. Where several pages 
+    claim a URL and none has the route, the oldest page gets it. Returns 
+    the number of routes added and removed.
+    """
+    missing, stale, conflicts = check_routes(page_model, route_model)
+    for start in range(0, len(stale), batch_size):
+        route_model.objects.filter(pk__in=stale[start:start + batch_size]
+                                   ).delete()
+    for start in range(0, len(missing), batch_size):
+        bulk_insert(route_model, [route_model(site_id=site_id, url=url,
+            page_id=page_id) for site_id, url, page_id in 
+            missing[start:start + batch_size]])
+    return len(missing), len(stale)
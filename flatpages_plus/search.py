@@ -0,0 +1,121 @@
+"""
+A simple full text search index for flatpages.
+
+Every word in a page's title, link name and content is stored in the 
+``SearchTerm`` table with a weight, so searches are indexed lookups on the 
+words rather than ``LIKE '%word%'`` scans of every page.
+"""
+import re
+
+from django.db.models import Count, Sum
+from django.utils.encoding import force_unicode
+
+from flatpages_plus import app_settings
+from flatpages_plus.models import FlatPage, SearchTerm
+from flatpages_plus.utils import bulk_insert, delete_all
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+TAG_RE = re.compile(r'<[^>]*>')
+MAX_TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+
+# Words too common to be worth indexing.
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 
+    'in', 'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that',
+    'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was', 
+    'will', 'with',
+))
+
+
+def tokenize(text):
+    """
+    Split text (which may contain HTML) into lowercase words, leaving out 
+    stop words and single characters.
+    """
+    # Replace tags with spaces rather than stripping them, so the words on 
+    # either side of a tag aren't run together.
+    words = WORD_RE.findall(TAG_RE.sub(' ', force_unicode(text)).lower())
+    return [word[:MAX_TERM_LENGTH] for word in words 
+            if len(word) > 1 and word not in STOP_WORDS]
+
+def get_term_weights(page):
+    """Return ``{term: weight}`` for a page."""
+    weights = {}
+    for text, weight in ((page.title, app_settings.SEARCH_TITLE_WEIGHT),
+                         (page.name, app_settings.SEARCH_NAME_WEIGHT),
+                         (page.content, 1)):
+        for term in tokenize(text or ''):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+def index_page(page):
+    """
+    Replace a page's entries in the search index.
+    """
+    SearchTerm.objects.filter(page=page).delete()
+    bulk_insert(SearchTerm, [SearchTerm(term=term, page_id=page.pk, 
+        weight=weight) for term, weight in get_term_weights(page).items()])
+
+def index_pages(page_ids, batch_size=200):
+    """
+    Rebuild the search index for the given pages, a batch at a time.
+    """
+    page_ids = list(page_ids)
+    for start in range(0, len(page_ids), batch_size):
+        batch = page_ids[start:start + batch_size]
+        SearchTerm.objects.filter(page__in=batch).delete()
+        terms = []
+        for page in FlatPage.objects.filter(pk__in=batch).only('title', 
+                'name', 'content'):
+            terms.extend([SearchTerm(term=term, page_id=page.pk, weight=weight) 
+                          for term, weight in get_term_weights(page).items()])
+        bulk_insert(SearchTerm, terms)
+    return len(page_ids)
+
+def rebuild_index(batch_size=200):
+    """Rebuild the whole search index."""
+    delete_all(SearchTerm)
+    return index_pages(FlatPage.objects.values_list('pk', flat=True), 
+                       batch_size)
+
+def matching_page_ids(query):
+    """
+    Return a query of the IDs of the pages containing every word in 
+    ``query``, for use in a ``pk__in`` filter, or None if the query has no 
+    searchable words.
+    """
+    terms = list(set(tokenize(query)))
+    if not terms:
+        return None
+    return SearchTerm.objects.filter(term__in=terms).values('page').annotate(
+        matched=Count('term')).filter(matched=len(terms)).values('page')
+
+def search(query, queryset=None, limit=20):
+    """
+    Return the pages in ``queryset`` that contain every word in ``query``,
+    best matches first, with their score in a ``search_score`` attribute.
+    """
+    terms = list(set(tokenize(query)))
+    if not terms:
+        return []
+    if queryset is None:
+        queryset = FlatPage.objects.all()
+    
+    # Sum the weights of each page's matching terms, keeping only the pages
+    # that match them all, in one grouped query on the term index.
+    matches = SearchTerm.objects.filter(term__in=terms, 
+        page__in=queryset.values('pk')).values('page').annotate(
+        matched=Count('term'), score=Sum('weight')).filter(
+        matched=len(terms)).order_by('-score')
+    if limit:
+        matches = matches[:int(limit)]
+    scores = [(match['page'], match['score']) for match in matches]
+    
+    pages = FlatPage.objects.in_bulk([page_id for page_id, score in scores])
+    results = []
+    for page_id, score in scores:
+        if page_id in pages:
+            page = pages[page_id]
+            page.search_score = score
+            results.append(page)
+    return results
@@ -0,0 +1,169 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_save, post_delete, \
+    pre_delete, pre_save
+from taggit.models import Tag, TaggedItem
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import bump_generation
+from flatpages_plus.models import FlatPage, FlatPageRoute, RelatedPage
+from flatpages_plus.purging import purge_all, purge_page, purge_tag, \
+    remember_url
+
+# This module is imported at the bottom of models.py. The lookup, related, 
+# routes and search modules import the models, so they are imported in the
+# handlers: importing one of them first would otherwise come back here 
+# before it has finished loading.
+
+
+def flatpage_changed(sender, instance, **kwargs):
+    """
+    Invalidate everything cached about the flatpages when one is saved or
+    deleted.
+    """
+    from flatpages_plus.lookup import clear_lookup_cache
+    bump_generation()
+    clear_lookup_cache()
+
+def flatpage_deleted(sender, instance, **kwargs):
+    """
+    Give the pages that were below a deleted page their new closest parent.
+    """
+    orphans = FlatPage.objects.filter(url__startswith=instance.url, 
+        depth__gt=instance.depth, parent__isnull=True)
+    for page in orphans:
+        FlatPage.objects.filter(pk=page.pk).update(parent=page.find_parent_id())
+
+def flatpage_saved(sender, instance, **kwargs):
+    """
+    Update the search index for a saved page.
+    """
+    from flatpages_plus.search import index_page
+    index_page(instance)
+
+def flatpage_deleting(sender, instance, **kwargs):
+    """
+    Remember which pages list a page as related before it's deleted.
+    """
+    if app_settings.RELATED_PAGES:
+        instance._related_page_of = list(RelatedPage.objects.filter(
+            related=instance).values_list('page', flat=True))
+
+def flatpage_deleted_related(sender, instance, **kwargs):
+    """
+    Rescore the pages that listed a deleted page as related.
+    """
+    page_ids = getattr(instance, '_related_page_of', None)
+    if page_ids:
+        from flatpages_plus.related import queue_related
+        queue_related(page_ids)
+
+def flatpage_routes_saved(sender, instance, created, **kwargs):
+    """
+    Move a saved page's routes to its new URL. New pages aren't on any 
+    sites yet; they get their routes when their sites are set.
+    """
+    if not created:
+        from flatpages_plus.routes import sync_routes
+        sync_routes(instance)
+
+def flatpage_routes_deleted(sender, instance, **kwargs):
+    """
+    Give a deleted page's routes to any other pages with the same URL.
+    """
+    from flatpages_plus.routes import sync_routes
+    for page in FlatPage.objects.filter(url=instance.url):
+        sync_routes(page)
+
+def flatpage_saving(sender, instance, **kwargs):
+    """
+    Remember a page's old URL so it can be purged if the page moves.
+    """
+    remember_url(instance)
+
+def flatpage_purge(sender, instance, **kwargs):
+    """
+    Purge a saved or deleted page, and the pages below it, from the caching
+    proxy.
+    """
+    purge_page(instance)
+
+post_save.connect(flatpage_changed, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_saved')
+post_save.connect(flatpage_saved, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_saved_search')
+post_delete.connect(flatpage_changed, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleted')
+post_delete.connect(flatpage_deleted, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleted_tree')
+pre_save.connect(flatpage_saving, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_saving_purge')
+post_save.connect(flatpage_purge, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_saved_purge')
+post_delete.connect(flatpage_purge, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleted_purge')
+post_save.connect(flatpage_routes_saved, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_saved_routes')
+post_delete.connect(flatpage_routes_deleted, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleted_routes')
+pre_delete.connect(flatpage_deleting, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleting_related')
+post_delete.connect(flatpage_deleted_related, sender=FlatPage, 
+    dispatch_uid='flatpages_plus.flatpage_deleted_related')
+
+def flatpage_sites_changed(sender, instance, action, pk_set=None, **kwargs):
+    """
+    Update the routes and parents, and invalidate the caches, when pages are
+    added to or removed from sites.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        from flatpages_plus.lookup import clear_lookup_cache
+        from flatpages_plus.routes import sync_routes
+        if isinstance(instance, FlatPage):
+            sync_routes(instance)
+            instance.update_parent()
+        else:
+            # The pages were changed from the site's side.
+            if pk_set is None:
+                pk_set = FlatPageRoute.objects.filter(site=instance
+                    ).values_list('page', flat=True)
+            for page in FlatPage.objects.filter(pk__in=list(pk_set)):
+                sync_routes(page)
+                page.update_parent()
+        bump_generation()
+        clear_lookup_cache()
+        if isinstance(instance, FlatPage):
+            purge_page(instance)
+        else:
+            purge_all()
+
+m2m_changed.connect(flatpage_sites_changed, sender=FlatPage.sites.through, 
+    dispatch_uid='flatpages_plus.flatpage_sites_changed')
+
+def flatpage_tags_changed(sender, instance, **kwargs):
+    """
+    Invalidate the caches, and queue the related pages that may have 
+    changed to be rescored, when a flatpage is tagged or untagged.
+    """
+    if instance.content_type_id == ContentType.objects.get_for_model(FlatPage).id:
+        bump_generation()
+        purge_tag(instance.tag, instance.object_id)
+        if app_settings.RELATED_PAGES:
+            from flatpages_plus.related import queue_related
+            queue_related([instance.object_id], [instance.tag_id])
+
+post_save.connect(flatpage_tags_changed, sender=TaggedItem, 
+    dispatch_uid='flatpages_plus.flatpage_tagged')
+post_delete.connect(flatpage_tags_changed, sender=TaggedItem, 
+    dispatch_uid='flatpages_plus.flatpage_untagged')
+
+def tag_changed(sender, instance, **kwargs):
+    """
+    Invalidate the caches when a tag is renamed or deleted.
+    """
+    bump_generation()
+    purge_tag(instance)
+
+post_save.connect(tag_changed, sender=Tag, 
+    dispatch_uid='flatpages_plus.tag_saved')
+post_delete.connect(tag_changed, sender=Tag, 
+    dispatch_uid='flatpages_plus.tag_deleted')
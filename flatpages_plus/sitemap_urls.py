@@ -0,0 +1,12 @@
+from django.conf.urls.defaults import *
+
+urlpatterns = patterns('flatpages_plus.sitemaps',
+    url(r'^sitemap-flatpages\.xml$',
+        view='sitemap_index',
+        name='flatpages_plus_sitemap_index'
+    ),
+    url(r'^sitemap-flatpages-(?P<shard>\d+)\.xml$',
+        view='sitemap_section',
+        name='flatpages_plus_sitemap_section'
+    ),
+)
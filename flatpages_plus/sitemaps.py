@@ -0,0 +1,143 @@
+"""
+Sitemaps for very large numbers of flatpages.
+
+The pages are split into parts by ID range, so a page always stays in the 
+same part. Each part is streamed from the database a row at a time and 
+cached gzipped against a signature of its pages (how many there are and 
+when the latest one was modified), so only the parts containing changed 
+pages are ever regenerated.
+
+Include ``flatpages_plus.sitemap_urls`` in your URLconf to use them.
+"""
+import gzip
+from cStringIO import StringIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse
+from django.utils.encoding import smart_str
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation, make_key
+from flatpages_plus.models import FlatPage
+
+W3C_DATE = '%Y-%m-%d'
+
+
+def get_pages():
+    """The pages that belong in the sitemap."""
+    return FlatPage.objects.filter(sites__id__exact=settings.SITE_ID, 
+        status='p', registration_required=False).order_by()
+
+def get_shard_range(shard):
+    size = app_settings.SITEMAP_SHARD_SIZE
+    return shard * size, (shard + 1) * size
+
+def get_shard_stats(shard):
+    """
+    Return the number of pages in a part and the latest time one of them 
+    was modified, with one query on the primary key range.
+    """
+    start, end = get_shard_range(shard)
+    stats = get_pages().filter(pk__gte=start, pk__lt=end).aggregate(
+        count=Count('pk'), modified=Max('modified'))
+    return stats['count'], stats['modified']
+
+def gzip_response(request, compressed):
+    """
+    Return gzipped content as is if the client accepts it, and uncompressed
+    otherwise.
+    """
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(compressed, mimetype='application/xml')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        content = gzip.GzipFile(fileobj=StringIO(compressed)).read()
+        response = HttpResponse(content, mimetype='application/xml')
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+def write_gzipped(lines):
+    buffer = StringIO()
+    output = gzip.GzipFile(fileobj=buffer, mode='wb')
+    try:
+        for line in lines:
+            output.write(smart_str(line))
+    finally:
+        output.close()
+    return buffer.getvalue()
+
+def sitemap_index(request):
+    """
+    List the sitemap parts that contain pages. The list is cached until any
+    flatpage changes.
+    """
+    domain = Site.objects.get_current().domain
+    protocol = request.is_secure() and 'https' or 'http'
+    key = make_key('sitemap_index', get_generation(), settings.SITE_ID, 
+                   protocol, domain)
+    content = cache.get(key)
+    if content is not None:
+        return HttpResponse(content, mimetype='application/xml')
+    
+    last_pk = get_pages().aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    base = '%s://%s' % (protocol, domain)
+    
+    def lines():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for shard in range(last_pk // app_settings.SITEMAP_SHARD_SIZE + 1):
+            count, modified = get_shard_stats(shard)
+            if not count:
+                continue
+            location = base + reverse('flatpages_plus_sitemap_section', 
+                                      kwargs={'shard': shard})
+            yield '<sitemap><loc>%s</loc>' % escape(location)
+            if modified:
+                yield '<lastmod>%s</lastmod>' % modified.strftime(W3C_DATE)
+            yield '</sitemap>\n'
+        yield '</sitemapindex>\n'
+    
+    content = ''.join(lines())
+    cache.set(key, content, app_settings.CACHE_TIMEOUT)
+    return HttpResponse(content, mimetype='application/xml')
+
+def sitemap_section(request, shard):
+    """
+    List the pages in one part of the sitemap.
+    """
+    shard = int(shard)
+    count, modified = get_shard_stats(shard)
+    if not count:
+        raise Http404('No such sitemap part.')
+    domain = Site.objects.get_current().domain
+    protocol = request.is_secure() and 'https' or 'http'
+    
+    key = make_key('sitemap', settings.SITE_ID, protocol, domain, shard, 
+                   count, modified)
+    compressed = cache.get(key)
+    if compressed is None:
+        start, end = get_shard_range(shard)
+        pages = get_pages().filter(pk__gte=start, pk__lt=end).values_list(
+            'url', 'modified').iterator()
+        base = '%s://%s' % (protocol, domain)
+        
+        def lines():
+            yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+            yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            for url, modified in pages:
+                yield '<url><loc>%s</loc>' % escape(base + url)
+                if modified:
+                    yield '<lastmod>%s</lastmod>' % modified.strftime(W3C_DATE)
+                yield '</url>\n'
+            yield '</urlset>\n'
+        
+        compressed = write_gzipped(lines())
+        # The key changes whenever the part's pages do, so keep it as long 
+        # as the cache will.
+        cache.set(key, compressed, app_settings.CACHE_TIMEOUT * 24)
+    return gzip_response(request, compressed)
@@ -0,0 +1,73 @@
+import threading
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from taggit.models import TaggedItem
+
+from flatpages_plus.caching import get_generation
+from flatpages_plus.models import FlatPage
+
+
+class TagIndex(object):
+    """
+    Keeps the set of page IDs for every tag on each site in memory, so tag 
+    unions, intersections and exclusions are set operations instead of 
+    joins through taggit's generic relation tables.
+    
+    Each site's index is rebuilt, with a single query, the first time it is 
+    used after any flatpage or tag changes.
+    """
+    
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+    
+    def _build(self, site_id):
+        content_type = ContentType.objects.get_for_model(FlatPage)
+        site_pages = FlatPage.objects.filter(sites__id=site_id).values('pk')
+        rows = TaggedItem.objects.filter(content_type=content_type, 
+            object_id__in=site_pages).values_list('tag__name', 'object_id')
+        index = {}
+        for name, page_id in rows:
+            index.setdefault(name, set()).add(page_id)
+        return dict([(name, frozenset(ids)) for name, ids in index.items()])
+    
+    def get_index(self, site_id=None):
+        """
+        Return a dictionary of ``{tag_name: frozenset(page_ids)}``.
+        """
+        if site_id is None:
+            site_id = settings.SITE_ID
+        generation = get_generation()
+        entry = self._indexes.get(site_id)
+        if entry is None or entry[0] != generation:
+            entry = (generation, self._build(site_id))
+            self._lock.acquire()
+            try:
+                self._indexes[site_id] = entry
+            finally:
+                self._lock.release()
+        return entry[1]
+    
+    def pages_with_any(self, tag_names, site_id=None):
+        """Return the IDs of pages tagged with any of ``tag_names``."""
+        index = self.get_index(site_id)
+        page_ids = set()
+        for name in tag_names:
+            page_ids |= index.get(name, frozenset())
+        return page_ids
+    
+    def pages_with_all(self, tag_names, site_id=None):
+        """Return the IDs of pages tagged with every one of ``tag_names``."""
+        index = self.get_index(site_id)
+        sets = [index.get(name, frozenset()) for name in tag_names]
+        if not sets:
+            return set()
+        sets.sort(key=len)
+        page_ids = set(sets[0])
+        for ids in sets[1:]:
+            page_ids &= ids
+        return page_ids
+
+
+tag_index = TagIndex()
@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.template import loader
+from django.template.loaders import app_directories, filesystem
+
+from flatpages_plus import app_settings
+
+# {% extends %} and {% include %} tags with a constant template name.
+DEPENDENCY_RE = re.compile(
+    r'{%\s*(?:extends|include)\s+["\']([^"\']+)["\']')
+
+
+def find_template_path(template_name):
+    """
+    Return the path of the file a template was loaded from, if it was loaded 
+    by the filesystem or app directories loaders.
+    """
+    for template_loader in (filesystem.Loader(), app_directories.Loader()):
+        for path in template_loader.get_template_sources(template_name):
+            if os.path.exists(path):
+                return path
+    return None
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def find_template_paths(template_name):
+    """
+    Return the files a template was loaded from: its own and, recursively, 
+    those of the templates it extends or includes by name.
+    """
+    paths = []
+    names = [template_name]
+    seen = set()
+    while names:
+        name = names.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        path = find_template_path(name)
+        if path is None:
+            continue
+        paths.append(path)
+        try:
+            source = open(path)
+            try:
+                names.extend(DEPENDENCY_RE.findall(source.read()))
+            finally:
+                source.close()
+        except IOError:
+            pass
+    return paths
+
+def get_mtimes(paths):
+    return tuple([get_mtime(path) for path in paths])
+
+
+class TemplateCache(object):
+    """
+    Caches compiled templates by the list of names they were selected from,
+    so the flatpage view doesn't search for and parse its template on every
+    request when Django's cached template loader isn't being used.
+    """
+    
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_template(self, template_names):
+        """
+        Return the first of ``template_names`` that exists, like 
+        ``loader.select_template()``.
+        """
+        template_names = tuple(template_names)
+        if settings.DEBUG or not app_settings.TEMPLATE_CACHE:
+            return loader.select_template(template_names)
+        
+        entry = self._templates.get(template_names)
+        if entry is not None:
+            template, paths, mtimes = entry
+            if (not app_settings.TEMPLATE_CACHE_CHECK_MTIME or
+                    get_mtimes(paths) == mtimes):
+                self.hits += 1
+                return template
+        
+        self.misses += 1
+        template = loader.select_template(template_names)
+        paths = []
+        if getattr(template, 'name', None):
+            paths = find_template_paths(template.name)
+        self._lock.acquire()
+        try:
+            self._templates[template_names] = (template, paths, 
+                                               get_mtimes(paths))
+        finally:
+            self._lock.release()
+        return template
+    
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._templates = {}
+        finally:
+            self._lock.release()
+    
+    def stats(self):
+        """
+        Return how many lookups this process has answered from the cache,
+        how many it had to load, and how many templates are cached.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'templates': len(self._templates),
+        }
+
+
+template_cache = TemplateCache()
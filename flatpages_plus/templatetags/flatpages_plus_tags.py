@@ -102,9 +102,14 @@
 # TODO: Add starts_with so we can list pages under a section (see above).
 
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from django.template.base import TemplateSyntaxError
 from django.template.defaulttags import token_kwargs
 
+from flatpages_plus import app_settings
+from flatpages_plus.breadcrumbs import get_breadcrumbs as _get_breadcrumbs
+from flatpages_plus.caching import get_generation, make_key
 from flatpages_plus.models import FlatPage
 
 register = template.Library()
@@ -123,19 +128,41 @@ class FlatpagesNode(template.Node):
         
         sort = values.get('sort', 'recent')
         tags = values.get('tags', None)
+        all_tags = values.get('all_tags', None)
         not_tags = values.get('not_tags', None)
         starts_with = values.get('starts_with', None)
         owners = values.get('owners', None)
         limit = values.get('limit', None)
         remove = values.get('remove', None)
+        fields = values.get('fields', None)
         
-        context[self.var_name] = FlatPage.objects.get_flatpages(sort=sort, 
+        cache_timeout = values.pop('cache', None)
+        
+        flatpages = None
+        if cache_timeout:
+            cache_timeout = int(cache_timeout)
+            if sort == 'random':
+                cache_timeout = min(cache_timeout, 
+                                    app_settings.RANDOM_CACHE_TIMEOUT)
+            key = make_key('get_flatpages', get_generation(), settings.SITE_ID,
+                           *sorted(values.items()))
+            flatpages = cache.get(key)
+        
+        if flatpages is None:
+            flatpages = FlatPage.objects.get_flatpages(sort=sort, 
                                             tags=tags, 
+                                            all_tags=all_tags,
                                             not_tags=not_tags,
                                             starts_with=starts_with,
                                             owners=owners, 
                                             limit=limit, 
-                                            remove=remove)
+                                            remove=remove,
+                                            fields=fields)
+            if cache_timeout:
+                flatpages = list(flatpages)
+                cache.set(key, flatpages, cache_timeout)
+        
+        context[self.var_name] = flatpages
         return ''
 
 @register.tag
@@ -158,6 +185,8 @@ def get_flatpages(parser, token):
         {% get_flatpages tags='foo,bar,baz' as flatpages %}
         {% get_flatpages starts_with='/about/' as about_pages %}
         {% get_flatpages sort='random' remove=flatpage.id limit=5 as random_flatpages %}
+        {% get_flatpages sort='views' limit=10 cache=300 as popular_flatpages %}
+        {% get_flatpages starts_with='/about/' fields='url,name' as menu %}
     
     All fields are optional. If nothing is passed to the templatetag, it will 
     return all flatpages, sorted by most recently created
@@ -176,6 +205,9 @@ def get_flatpages(parser, token):
         tags='foo,bar,baz'          Returns all flatpages tagged with _either_      
                                     'foo', 'bar', or 'baz'. Optional.
         
+        all_tags='foo,bar'          Returns only flatpages tagged with _both_
+                                    'foo' and 'bar'. Optional.
+        
         not_tags='foo,bar'          Removes any flatpages tagged with 'foo' or
                                     'bar' from the QuerySet.
     
@@ -194,6 +226,16 @@ def get_flatpages(parser, token):
                                     the results list. Can be a string of IDs 
                                     (e.g. '1,5,6,8,234') or an integer 
                                     (e.g. 1). Optional.
+        
+        fields='url,name,title'     Only loads the given fields, so the 
+                                    content of every page isn't fetched. 
+                                    Optional.
+        
+        cache=300                   Caches the results for 300 seconds, or 
+                                    until any flatpage or tag changes. Random
+                                    results are only cached for a few 
+                                    seconds. Cached results are a list, not
+                                    a QuerySet. Optional.
     
     """
     bits = token.split_contents()
@@ -207,3 +249,120 @@ def get_flatpages(parser, token):
     extra_context = token_kwargs(remaining_bits, parser)
     return FlatpagesNode(extra_context, var_name)
 
+
+class BreadcrumbsNode(template.Node):
+    
+    def __init__(self, page, var_name):
+        self.page = page
+        self.var_name = var_name
+    
+    def render(self, context):
+        context[self.var_name] = _get_breadcrumbs(self.page.resolve(context))
+        return ''
+
+@register.tag
+def get_breadcrumbs(parser, token):
+    """
+    Returns the breadcrumbs for a flatpage as a list of dictionaries with 
+    ``url`` and ``name`` keys (``url`` is None for levels without a page).
+    
+    Example usage::
+    
+        {% get_breadcrumbs flatpage %}
+        {% get_breadcrumbs flatpage as crumbs %}
+    
+    The breadcrumbs are looked up with a single query and cached until any 
+    flatpage changes.
+    """
+    bits = token.split_contents()
+    if len(bits) == 2:
+        var_name = 'breadcrumbs'
+    elif len(bits) == 4 and bits[2] == 'as':
+        var_name = bits[3]
+    else:
+        raise TemplateSyntaxError("%s expects a syntax of %s flatpage "
+                                  "[as context_name]" % (bits[0], bits[0]))
+    return BreadcrumbsNode(parser.compile_filter(bits[1]), var_name)
+
+
+class SearchNode(template.Node):
+    
+    def __init__(self, query, limit, var_name):
+        self.query = query
+        self.limit = limit
+        self.var_name = var_name
+    
+    def render(self, context):
+        limit = 20
+        if self.limit is not None:
+            limit = self.limit.resolve(context)
+        context[self.var_name] = FlatPage.objects.search(
+            self.query.resolve(context), limit=limit)
+        return ''
+
+@register.tag
+def search_flatpages(parser, token):
+    """
+    Searches the published flatpages for pages containing every word in a 
+    query, best matches first. Each page has a ``search_score`` attribute.
+    
+    Example usage::
+    
+        {% search_flatpages request.GET.q as results %}
+        {% search_flatpages 'contact us' limit=5 as results %}
+    
+    Returns up to 20 results unless a limit is given.
+    """
+    bits = token.split_contents()
+    syntax_message = ("%(tag_name)s expects a syntax of %(tag_name)s "
+                      "query [limit=n] as context_name" % dict(tag_name=bits[0]))
+    if len(bits) not in (4, 5) or bits[-2] != 'as':
+        raise TemplateSyntaxError(syntax_message)
+    limit = None
+    if len(bits) == 5:
+        kwargs = token_kwargs([bits[2]], parser)
+        if 'limit' not in kwargs:
+            raise TemplateSyntaxError(syntax_message)
+        limit = kwargs['limit']
+    return SearchNode(parser.compile_filter(bits[1]), limit, bits[-1])
+
+
+class RelatedFlatpagesNode(template.Node):
+    
+    def __init__(self, page, limit, var_name):
+        self.page = page
+        self.limit = limit
+        self.var_name = var_name
+    
+    def render(self, context):
+        limit = None
+        if self.limit is not None:
+            limit = self.limit.resolve(context)
+        context[self.var_name] = FlatPage.objects.related_to(
+            self.page.resolve(context), limit=limit)
+        return ''
+
+@register.tag
+def get_related_flatpages(parser, token):
+    """
+    Returns the published flatpages most related to a page by their tags, 
+    best first. The related pages are worked out ahead of time, so this is
+    a single query.
+    
+    Example usage::
+    
+        {% get_related_flatpages flatpage as related %}
+        {% get_related_flatpages flatpage limit=5 as related %}
+    """
+    bits = token.split_contents()
+    syntax_message = ("%(tag_name)s expects a syntax of %(tag_name)s "
+                      "flatpage [limit=n] as context_name" % dict(tag_name=bits[0]))
+    if len(bits) not in (4, 5) or bits[-2] != 'as':
+        raise TemplateSyntaxError(syntax_message)
+    limit = None
+    if len(bits) == 5:
+        kwargs = token_kwargs([bits[2]], parser)
+        if 'limit' not in kwargs:
+            raise TemplateSyntaxError(syntax_message)
+        limit = kwargs['limit']
+    return RelatedFlatpagesNode(parser.compile_filter(bits[1]), limit, bits[-1])
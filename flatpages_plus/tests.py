@@ -0,0 +1,335 @@
+import BaseHTTPServer
+import os
+import re
+import tempfile
+import threading
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.test import TestCase
+from django.utils import simplejson, unittest
+
+from flatpages_plus import app_settings
+from flatpages_plus.models import FlatPage, FlatPageRoute, RelatedPage, \
+    SearchTerm
+from flatpages_plus.purging import HTTPPurger, PurgeQueue
+from flatpages_plus.search import tokenize
+
+# A plan step that reads a whole table, as opposed to "SCAN ... USING INDEX"
+# or "SEARCH ...". Older SQLite versions say "SCAN TABLE name". The \b stops
+# the lookahead from matching part way through the table name.
+FULL_SCAN_RE = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)\b(?!.*\bUSING\b)')
+
+
+class FullScanTest(unittest.TestCase):
+    """
+    Only plan steps that read a whole table should count as full scans.
+    """
+    
+    def test_full_scan(self):
+        for detail in ('SCAN flatpages_plus_flatpage',
+                       'SCAN TABLE flatpages_plus_flatpage',
+                       'SCAN TABLE flatpages_plus_flatpage AS T3'):
+            match = FULL_SCAN_RE.match(detail)
+            self.assertTrue(match, detail)
+            self.assertEqual(match.group('table'), 'flatpages_plus_flatpage')
+    
+    def test_index_scan(self):
+        for detail in (
+            'SCAN flatpages_plus_flatpage USING INDEX flatpages_plus_flatpage_modified',
+            'SCAN TABLE flatpages_plus_flatpage USING INDEX flatpages_plus_flatpage_views',
+            'SCAN flatpages_plus_flatpage_sites USING COVERING INDEX flatpages_plus_flatpage_sites_site_id',
+            'SEARCH flatpages_plus_flatpage USING INTEGER PRIMARY KEY (rowid=?)',
+        ):
+            self.assertFalse(FULL_SCAN_RE.match(detail), detail)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 
+                     "Query plans are only checked on SQLite.")
+class QueryPlanTest(TestCase):
+    """
+    None of the get_flatpages() sort and filter combinations should read a 
+    whole table, and the sorted listings should be read in index order 
+    rather than sorted afterwards.
+    """
+    
+    sorts = ('modified', '-modified', 'created', '-created', 'views', '-views',
+             'random')
+    
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        site = Site.objects.get_current()
+        for i in range(60):
+            page = FlatPage.objects.create(url='/about/page-%d/' % i, 
+                title='Page %d' % i, owner=self.owner, views=i, status='p')
+            page.sites.add(site)
+            if i % 3 == 0:
+                page.tags.add('foo')
+        # Without statistics SQLite starts from the sites table and sorts.
+        connection.cursor().execute('ANALYZE')
+        # Check the queries that go to the database when the tag index 
+        # can't answer them.
+        self.tag_index = app_settings.TAG_INDEX
+        app_settings.TAG_INDEX = False
+    
+    def tearDown(self):
+        app_settings.TAG_INDEX = self.tag_index
+    
+    def explain(self, sort, kwargs):
+        """
+        Return the details of each step of the query's plan.
+        """
+        query_set = FlatPage.objects.get_flatpages(sort=sort, **kwargs)
+        try:
+            sql, params = query_set.query.get_compiler(
+                connection=connection).as_sql()
+        except EmptyResultSet:
+            return []
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        # The detail is the last column in every version of SQLite.
+        return [row[-1] for row in cursor.fetchall()]
+    
+    def test_no_full_scans(self):
+        filters = (
+            {},
+            {'tags': 'foo'},
+            {'all_tags': 'foo'},
+            {'not_tags': 'foo'},
+            {'starts_with': '/about/'},
+            {'owners': str(self.owner.pk)},
+            {'remove': '1'},
+        )
+        for sort in self.sorts:
+            for kwargs in filters:
+                plan = self.explain(sort, kwargs)
+                self.assertFalse([d for d in plan if FULL_SCAN_RE.match(d)],
+                    "get_flatpages(sort=%r, **%r): %s" % (sort, kwargs, plan))
+    
+    def test_sorted_by_index(self):
+        for sort in self.sorts[:-1]:
+            for kwargs in ({}, {'owners': str(self.owner.pk)}):
+                plan = self.explain(sort, kwargs)
+                self.assertFalse([d for d in plan if 'TEMP B-TREE' in d],
+                    "get_flatpages(sort=%r, **%r): %s" % (sort, kwargs, plan))
+
+
+class BulkCommandTest(TestCase):
+    """
+    Dumping and loading flatpages through the management commands.
+    """
+    
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.site = Site.objects.get_current()
+        page = FlatPage.objects.create(url='/about/', title='About', 
+            content='About us', owner=self.owner, status='p')
+        page.sites.add(self.site)
+        page.tags.add('company')
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+    
+    def tearDown(self):
+        os.remove(self.path)
+    
+    def read(self):
+        lines = open(self.path).readlines()
+        return [simplejson.loads(line) for line in lines]
+    
+    def write(self, records):
+        output = open(self.path, 'w')
+        try:
+            for record in records:
+                output.write(simplejson.dumps(record) + '\n')
+        finally:
+            output.close()
+    
+    def test_dump(self):
+        call_command('dump_flatpages', self.path, verbosity=0)
+        records = self.read()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['url'], '/about/')
+        self.assertEqual(records[0]['owner'], 'owner')
+        self.assertEqual(records[0]['tags'], ['company'])
+    
+    def test_load(self):
+        call_command('dump_flatpages', self.path, verbosity=0)
+        records = self.read()
+        records[0]['title'] = 'About Us'
+        records.append(dict(records[0], url='/about/team/', title='Team',
+                            tags=['company', 'people']))
+        self.write(records)
+        call_command('load_flatpages', self.path, verbosity=0)
+        
+        about = FlatPage.objects.get(url='/about/')
+        self.assertEqual(about.title, 'About Us')
+        self.assertEqual(about.owner, self.owner)
+        team = FlatPage.objects.get(url='/about/team/')
+        self.assertEqual(team.owner, self.owner)
+        self.assertEqual(team.parent, about)
+        self.assertEqual(list(team.sites.all()), [self.site])
+        self.assertEqual(sorted(team.tags.names()), ['company', 'people'])
+        self.assertTrue(FlatPageRoute.objects.filter(site=self.site, 
+            url='/about/team/', page=team).exists())
+
+
+class RoutesTest(TestCase):
+    """
+    Checking and fixing the routes.
+    """
+    
+    def setUp(self):
+        self.site = Site.objects.get_current()
+        self.page = FlatPage.objects.create(url='/about/', title='About', 
+            owner=User.objects.create(username='owner'), status='p')
+        self.page.sites.add(self.site)
+    
+    def test_routes_follow_sites(self):
+        self.assertTrue(FlatPageRoute.objects.filter(site=self.site, 
+            url='/about/', page=self.page).exists())
+        self.page.sites.clear()
+        self.assertFalse(FlatPageRoute.objects.filter(page=self.page).exists())
+    
+    def test_check_and_fix(self):
+        call_command('check_flatpage_routes', verbosity=0)
+        FlatPageRoute.objects.all().delete()
+        # Django 1.3 and 1.4 turn the CommandError into a SystemExit.
+        self.assertRaises((CommandError, SystemExit), call_command, 
+            'check_flatpage_routes', verbosity=0, stderr=StringIO())
+        call_command('check_flatpage_routes', fix=True, verbosity=0)
+        self.assertTrue(FlatPageRoute.objects.filter(site=self.site, 
+            url='/about/', page=self.page).exists())
+        call_command('check_flatpage_routes', verbosity=0)
+
+
+class SearchTest(TestCase):
+    """
+    The search index.
+    """
+    
+    def test_tokenize_splits_at_tags(self):
+        self.assertEqual(tokenize('<h1>H 5</h1><p>word5 common</p>'),
+                         ['word5', 'common'])
+    
+    def test_rebuild_index(self):
+        page = FlatPage.objects.create(url='/about/', title='About', 
+            content='<h1>H 5</h1><p>word5 common</p>', status='p',
+            owner=User.objects.create(username='owner'))
+        page.sites.add(Site.objects.get_current())
+        SearchTerm.objects.all().delete()
+        call_command('rebuild_flatpage_search_index', verbosity=0)
+        self.assertEqual(FlatPage.objects.search('word5'), [page])
+        self.assertEqual(FlatPage.objects.search('5word5'), [])
+
+
+class RelatedPagesTest(TestCase):
+    """
+    Rebuilding the related pages.
+    """
+    
+    def setUp(self):
+        owner = User.objects.create(username='owner')
+        site = Site.objects.get_current()
+        self.pages = {}
+        for name, tags in (('a', ['x', 'y']), ('b', ['x', 'y']), ('c', ['x'])):
+            page = FlatPage.objects.create(url='/%s/' % name, title=name, 
+                owner=owner, status='p')
+            page.sites.add(site)
+            page.tags.add(*tags)
+            self.pages[name] = page
+        self.max_tag_pages = app_settings.RELATED_PAGES_MAX_TAG_PAGES
+    
+    def tearDown(self):
+        app_settings.RELATED_PAGES_MAX_TAG_PAGES = self.max_tag_pages
+    
+    def related_to(self, name):
+        return list(FlatPage.objects.related_to(self.pages[name]))
+    
+    def test_rebuild(self):
+        RelatedPage.objects.all().delete()
+        call_command('rebuild_related_flatpages', verbosity=0)
+        self.assertEqual(self.related_to('a'), [self.pages['b'], 
+                                                self.pages['c']])
+        # Both score the same, so they can come back in either order.
+        self.assertEqual(set(self.related_to('c')), 
+                         set([self.pages['a'], self.pages['b']]))
+    
+    def test_common_tags_are_not_shared(self):
+        # 'x' is on all three pages.
+        app_settings.RELATED_PAGES_MAX_TAG_PAGES = 2
+        call_command('rebuild_related_flatpages', verbosity=0)
+        self.assertEqual(self.related_to('a'), [self.pages['b']])
+        self.assertEqual(self.related_to('c'), [])
+
+
+class PurgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    A stand-in purge endpoint that records the surrogate keys of every 
+    request it gets. Paths starting with /error/ get a 500 response, and 
+    paths starting with /hangup/ close the connection without answering.
+    """
+    
+    def do_PURGE(self):
+        if self.path.startswith('/error/'):
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path.startswith('/hangup/'):
+            self.close_connection = 1
+            return
+        self.server.purges.append((self.command, self.path, 
+            self.headers.get(app_settings.SURROGATE_KEY_HEADER)))
+        self.send_response(200)
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+
+class PurgeTest(unittest.TestCase):
+    """
+    The HTTP purger and the purge queue, against a local purge endpoint.
+    """
+    
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), PurgeHandler)
+        self.server.purges = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/purge/' % self.server.server_port
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_purge(self):
+        HTTPPurger(url=self.url).purge(['page-1', 'tag-news'])
+        self.assertEqual(self.server.purges, 
+                         [('PURGE', '/purge/', 'page-1 tag-news')])
+    
+    def test_queue_sends_batches(self):
+        queue = PurgeQueue(batch_size=2, purger=HTTPPurger(url=self.url))
+        queue.add(['page-1'])
+        self.assertEqual(self.server.purges, [])
+        # Duplicate keys are only sent once.
+        queue.add(['page-1', 'page-2', 'url-/about/'])
+        self.assertEqual([keys for method, path, keys in self.server.purges],
+                         ['page-1 page-2', 'url-/about/'])
+        self.assertEqual(queue.flush(), 0)
+    
+    def test_failed_purges_are_dropped(self):
+        # The endpoint returns an error.
+        HTTPPurger(url=self.url.replace('/purge/', '/error/')).purge(['page-1'])
+        # The endpoint hangs up without answering.
+        HTTPPurger(url=self.url.replace('/purge/', '/hangup/')).purge(['page-1'])
+        # Nothing is listening.
+        self.server.shutdown()
+        self.server.server_close()
+        HTTPPurger(url=self.url, timeout=1).purge(['page-1'])
+        self.assertEqual(self.server.purges, [])
@@ -0,0 +1,170 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+
+from flatpages_plus import app_settings
+from flatpages_plus.caching import get_generation
+from flatpages_plus.models import FlatPage
+
+HITS_KEY = 'flatpages_plus:url_filter:hits'
+REJECTIONS_KEY = 'flatpages_plus:url_filter:rejections'
+# How many lookups each process counts before adding them to the totals in
+# the cache.
+COUNT_FLUSH_THRESHOLD = 100
+COUNT_TIMEOUT = 60 * 60 * 24 * 30
+
+
+class BloomFilter(object):
+    """
+    A compact set membership test that never gives false negatives and gives
+    false positives at about ``error_rate`` once ``capacity`` items are added.
+    """
+    
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(
+            float(self.num_bits) / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item):
+        # Derive all the hashes from one digest (Kirsch-Mitzenmacher).
+        digest = hashlib.md5(smart_str(item)).hexdigest()
+        h1, h2 = int(digest[:16], 16), int(digest[16:], 16)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+    
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position // 8] |= 1 << (position % 8)
+        self.count += 1
+    
+    def __contains__(self, item):
+        for position in self._positions(item):
+            if not self.bits[position // 8] & (1 << (position % 8)):
+                return False
+        return True
+    
+    def __len__(self):
+        return self.count
+    
+    @property
+    def false_positive_rate(self):
+        """The expected false positive rate for the items added so far."""
+        return (1 - math.exp(-float(self.num_hashes) * self.count / 
+                             self.num_bits)) ** self.num_hashes
+
+
+class FlatpageUrlFilter(object):
+    """
+    Keeps a Bloom filter of the flatpage URLs on each site.
+    
+    Each site's filter is rebuilt, with a single query, the first time it is
+    used after any flatpage changes, or once it is older than ``timeout`` 
+    seconds.
+    
+    The number of URLs let through and rejected are added up across 
+    processes in the cache, a batch at a time.
+    """
+    
+    def __init__(self, error_rate=None, timeout=None):
+        if error_rate is None:
+            error_rate = app_settings.URL_FILTER_ERROR_RATE
+        if timeout is None:
+            timeout = app_settings.URL_FILTER_TIMEOUT
+        self.error_rate = error_rate
+        self.timeout = timeout
+        self._filters = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._rejections = 0
+    
+    def _build(self, site_id):
+        urls = list(FlatPage.objects.filter(sites__id__exact=site_id)
+                                    .values_list('url', flat=True))
+        bloom = BloomFilter(len(urls), self.error_rate)
+        for url in urls:
+            bloom.add(url)
+        return bloom
+    
+    def get_filter(self, site_id=None):
+        if site_id is None:
+            site_id = settings.SITE_ID
+        generation = get_generation()
+        now = time.time()
+        entry = self._filters.get(site_id)
+        if (entry is None or entry[0] != generation or 
+                now - entry[1] >= self.timeout):
+            entry = (generation, now, self._build(site_id))
+            self._lock.acquire()
+            try:
+                self._filters[site_id] = entry
+            finally:
+                self._lock.release()
+        return entry[2]
+    
+    def might_exist(self, url, site_id=None):
+        """
+        Return False if there definitely isn't a flatpage at ``url``.
+        """
+        found = url in self.get_filter(site_id)
+        self._lock.acquire()
+        try:
+            if found:
+                self._hits += 1
+            else:
+                self._rejections += 1
+            due = self._hits + self._rejections >= COUNT_FLUSH_THRESHOLD
+        finally:
+            self._lock.release()
+        if due:
+            self.flush_counts()
+        return found
+    
+    def flush_counts(self):
+        """
+        Add this process's counts to the totals in the cache.
+        """
+        self._lock.acquire()
+        try:
+            counts = ((HITS_KEY, self._hits), (REJECTIONS_KEY, self._rejections))
+            self._hits = self._rejections = 0
+        finally:
+            self._lock.release()
+        for key, count in counts:
+            if not count:
+                continue
+            if not cache.add(key, count, COUNT_TIMEOUT):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.add(key, count, COUNT_TIMEOUT)
+    
+    def stats(self, site_id=None):
+        """
+        Return a dictionary describing the filter for a site, and how many 
+        URLs all the processes have let through or rejected (give or take 
+        the last batch of each).
+        """
+        self.flush_counts()
+        bloom = self.get_filter(site_id)
+        counts = cache.get_many([HITS_KEY, REJECTIONS_KEY])
+        return {
+            'urls': len(bloom),
+            'bits': bloom.num_bits,
+            'bytes': len(bloom.bits),
+            'hashes': bloom.num_hashes,
+            'false_positive_rate': bloom.false_positive_rate,
+            'hits': counts.get(HITS_KEY, 0),
+            'rejections': counts.get(REJECTIONS_KEY, 0),
+        }
+
+
+url_filter = FlatpageUrlFilter()
@@ -0,0 +1,108 @@
+import re
+
+from django.db import connections, router, transaction
+
+# Matches everything up to the last section of a URL (the parent page).
+PARENT_URL_RE = re.compile(r'(?P<url>.*/)[-\w\.]+/?$')
+
+
+def get_parent_url(url):
+    """
+    Trim the last section off a URL, returning None if there is no parent.
+    """
+    match = PARENT_URL_RE.match(url)
+    if match:
+        return match.group('url')
+    return None
+
+def get_ancestor_urls(url):
+    """
+    Return the URLs of all the pages above ``url``, starting with the root 
+    and ending with ``url`` itself.
+    
+        >>> get_ancestor_urls('/about/team/')
+        ['/', '/about/', '/about/team/']
+    """
+    urls = []
+    while url:
+        urls.append(url)
+        url = get_parent_url(url)
+    urls.reverse()
+    return urls
+
+def get_url_depth(url):
+    """
+    Return how many levels below the root a URL is.
+    
+        >>> get_url_depth('/'), get_url_depth('/about/team/')
+        (0, 2)
+    """
+    return len([part for part in url.split('/') if part])
+
+def find_parent_id(url, pages_by_url):
+    """
+    Return the ID of the closest page above ``url`` in a ``{url: page_id}`` 
+    dictionary, or None if there isn't one.
+    """
+    for ancestor_url in reversed(get_ancestor_urls(url)[:-1]):
+        if ancestor_url in pages_by_url:
+            return pages_by_url[ancestor_url]
+    return None
+
+def rebuild_tree(model):
+    """
+    Recalculate the parent and depth of every flatpage.
+    
+    Takes the model class so it can be used from migrations. A page's 
+    parent is the closest page above it on any of its sites. Pages are 
+    updated in groups that share a parent and depth, rather than one at a 
+    time.
+    """
+    pages = list(model.objects.values_list('pk', 'url'))
+    urls = dict(pages)
+    page_sites = {}
+    pages_by_site = {}
+    for page_id, site_id in model.sites.through.objects.values_list(
+            'flatpage', 'site'):
+        page_sites.setdefault(page_id, []).append(site_id)
+        pages_by_site.setdefault(site_id, {})[urls[page_id]] = page_id
+    groups = {}
+    for pk, url in pages:
+        # The deepest of the closest pages on each of the page's sites.
+        candidates = [find_parent_id(url, pages_by_site[site_id]) 
+                      for site_id in page_sites.get(pk, [])]
+        candidates = [c for c in candidates if c is not None and c != pk]
+        parent_id = None
+        if candidates:
+            parent_id = max(candidates, key=lambda c: get_url_depth(urls[c]))
+        key = (parent_id, get_url_depth(url))
+        groups.setdefault(key, []).append(pk)
+    for (parent_id, depth), page_ids in groups.items():
+        for start in range(0, len(page_ids), 500):
+            model.objects.filter(pk__in=page_ids[start:start + 500]).update(
+                parent=parent_id, depth=depth)
+    return len(pages)
+
+def bulk_insert(model, objects):
+    """
+    Insert ``objects`` with one query using ``bulk_create`` on Django 1.4 and
+    later, or one at a time on Django 1.3.
+    """
+    manager = model._default_manager
+    if hasattr(manager, 'bulk_create'):
+        manager.bulk_create(objects)
+    else:
+        for obj in objects:
+            obj.save(force_insert=True)
+
+def delete_all(model):
+    """
+    Empty a model's table with a single ``DELETE``. ``QuerySet.delete()`` 
+    loads every row first on Django 1.3 and 1.4, so only use this for 
+    tables that no other table points to and that have no delete signals.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    connection.cursor().execute('DELETE FROM %s' % 
+        connection.ops.quote_name(model._meta.db_table))
+    transaction.commit_unless_managed(using=using)
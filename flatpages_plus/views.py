@@ -1,15 +1,28 @@
-import re
+from __future__ import with_statement
+
+import hashlib
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.core.xheaders import populate_xheaders
-from django.http import HttpResponse, HttpResponseRedirect, Http404
-from django.shortcuts import get_object_or_404
-from django.template import loader, RequestContext
+from django.http import HttpResponse, HttpResponseNotModified, \
+    HttpResponseRedirect, Http404
+from django.template import RequestContext
+from django.utils.encoding import smart_str
+from django.utils.http import parse_etags, quote_etag
 from django.utils.safestring import mark_safe
 from django.views.decorators.csrf import csrf_protect
 
+from flatpages_plus import app_settings
+from flatpages_plus.breadcrumbs import get_breadcrumbs
+from flatpages_plus.caching import get_generation, make_key
+from flatpages_plus.counters import record_view
+from flatpages_plus.instrumentation import instrumented, note, phase
+from flatpages_plus.lookup import get_flatpage_or_404
 from flatpages_plus.models import FlatPage
+from flatpages_plus.purging import set_cache_headers
+from flatpages_plus.template_cache import template_cache
 
 DEFAULT_TEMPLATE = 'flatpages_plus/default.html'
 
@@ -21,6 +34,7 @@ DEFAULT_TEMPLATE = 'flatpages_plus/default.html'
 # or a redirect is required for authentication, the 404 needs to be returned
 # without any CSRF checks. Therefore, we only
 # CSRF protect the internal implementation.
+@instrumented
 def flatpage(request, url, **kwargs):
     """
     Public interface to the flat page view.
@@ -36,10 +50,11 @@ def flatpage(request, url, **kwargs):
         return HttpResponseRedirect("%s/" % request.path)
     if not url.startswith('/'):
         url = "/" + url
-    f = get_object_or_404(FlatPage, url__exact=url, #status='p',
-        sites__id__exact=settings.SITE_ID)
+    with phase('lookup'):
+        f = get_flatpage_or_404(url)
     return render_flatpage(request, f)
 
+@instrumented
 @csrf_protect
 def render_flatpage(request, f):
     """
@@ -53,107 +68,123 @@ def render_flatpage(request, f):
     if f.registration_required and not request.user.is_authenticated():
         from django.contrib.auth.views import redirect_to_login
         return redirect_to_login(request.path)
-    if f.template_name:
-        t = loader.select_template((f.template_name, DEFAULT_TEMPLATE))
-    else:
-        t = loader.get_template(DEFAULT_TEMPLATE)
     
-    # Track pageviews (but not of owner).
-    if request.user != f.owner:
-        f.views += 1
-        f.save()
+    # Track pageviews (but not of owner). Compare IDs so we don't have to 
+    # load the owner.
+    if request.user.id != f.owner_id:
+        with phase('view_count'):
+            record_view(f)
     
-    # To avoid having to always use the "|safe" filter in flatpage templates,
-    # mark the title and content as already safe (since they are raw HTML
-    # content in the first place).
-    f.title = mark_safe(f.title)
-    f.content = mark_safe(f.content)
+    # If the client already has this version of the page, tell it so before 
+    # doing any of the work of rendering it. Only pages that are the same for
+    # everyone get an ETag; a logged in user's copy of a page may differ from
+    # the one they'd see after logging out.
+    cacheable = is_cacheable(request, f)
+    etag = None
+    if cacheable:
+        etag = flatpage_etag(f)
+        if not_modified(request, etag):
+            note('conditional', 'not_modified')
+            response = HttpResponseNotModified()
+            set_conditional_headers(response, etag)
+            set_cache_headers(response, f, cacheable)
+            return response
     
-    # Create breadcrumb navigation links.
-    # breadcrumb_urls = f.url.lstrip('/').rstrip('/').split('/')
-    # breadcrumb_urls.insert(0, '/')
-    # 
-    # for i, u in enumerate(breadcrumb_urls):
-    #     try: # Try and get a flatpage instance from the URL.
-    #         if u != '/':
-    #             u = '/%s/' % u
-    #         fp = FlatPage.objects.get(url__exact=u)
-    #         bt = fp.title
-    #         bu = fp.url
-    #     except: # Default to the URL slug, capitalized if no flatpage was found.
-    #         bt = u.capitalize()
-    #         bu = None
-    #     breadcrumbs += [{ # Contsruct a dictionary for the breadcrumb entity.
-    #         'url': bu,
-    #         'title': bt,
-    #     }]
+    # Serve anonymous visitors from the response cache when it's enabled.
+    cache_key = None
+    if app_settings.RESPONSE_CACHE and cacheable:
+        cache_key = make_key('response', settings.SITE_ID, f.url, etag)
+        content = cache.get(cache_key)
+        note('response_cache', content is None and 'miss' or 'hit')
+        if content is not None:
+            response = HttpResponse(content)
+            populate_xheaders(request, response, FlatPage, f.id)
+            set_conditional_headers(response, etag)
+            set_cache_headers(response, f, cacheable)
+            return response
     
+    content = render_flatpage_content(request, f)
+    # Pages that include a CSRF token are specific to the user, so they 
+    # aren't cached here or downstream.
+    if request.META.get('CSRF_COOKIE_USED'):
+        cacheable = False
+    if cache_key and cacheable:
+        cache.set(cache_key, content, app_settings.RESPONSE_CACHE_TIMEOUT)
     
+    response = HttpResponse(content)
+    populate_xheaders(request, response, FlatPage, f.id)
+    if cacheable:
+        set_conditional_headers(response, etag)
+    set_cache_headers(response, f, cacheable)
+    return response
+    # TODO: Use render_to_response here...
 
-    breadcrumb_urls = []
-    breadcrumbs = []
-
-    def trim_page(url):
-        """Trim the last section off a URL."""
-        regex = re.compile(r'(?P<url>.*/)[-\w\.]+/?$')
-        try:
-            trimmed_url = regex.match(url).group('url') # Return the parent page
-        except:
-            trimmed_url = None # Return None to indicate no parent.
-        return trimmed_url
-
-    def do_trimming(url):
-        """Perform the trimming operations recursively."""
-        breadcrumb_urls.append(url)
-        trimmed_url = trim_page(url)
-        if trimmed_url:
-            do_trimming(trimmed_url)
+def render_flatpage_content(request, f, site_id=None):
+    """
+    Render a flatpage with its template and return the HTML. The breadcrumbs
+    come from the given site (the current site by default).
+    """
+    with phase('template'):
+        if f.template_name:
+            t = template_cache.get_template((f.template_name, DEFAULT_TEMPLATE))
         else:
-            return True
-    
-    # Trim the flatpage's URL.
-    do_trimming(f.url)
+            t = template_cache.get_template((DEFAULT_TEMPLATE,))
     
-    # Reverse the list of breadcrumbs so the parent pages start first.
-    breadcrumb_urls.reverse()
-    
-    # Loop through the list of pages and construct a list of url/title dictionaries
-    # for each page to use in the templates.
-    for i, u in enumerate(breadcrumb_urls):
-        bn = ''
-        bu = ''
-        try: # Try and get a flatpage instance from the URL.
-            # if u != '/':
-            #     u = '/%s/' % u
-            fp = FlatPage.objects.get(url__exact=u)
-            bn = fp.name
-            bu = fp.url
-        except: # Try to handle missing pages cleanly.
-            regex = re.compile(r'.*/(?P<url>[-\w\.]+)/?$')
-            try:
-                # Default to the URL slug of the last segment of the URL 
-                # (capitalized) if no flatpage was found. This gives us an 
-                # OK default for missing pages.
-                bn = regex.match(u).group('url')
-            except:
-                # Worst case scenario we show the URL as the title if we can't 
-                # grab the last bit of the URL...
-                bn = u
-            bn = bn.capitalize() # Capitalize it to make it look a little nicer.
-            # Return None if the flatpage doesn't exist so we don't link to it, 
-            # because it would cause a 404 error if we did.
-            bu = None
-        breadcrumbs += [{ # Contsruct a dictionary for the breadcrumb entity.
-            'url': bu,
-            'name': bn,
-        }]
+    # To avoid having to always use the "|safe" filter in flatpage templates,
+    # mark the title and content as already safe (since they are raw HTML
+    # content in the first place). The content has already been through the
+    # content processors when the page was saved; pages saved before they 
+    # were added fall back to the raw content.
+    f.title = mark_safe(f.title)
+    f.content = mark_safe(f.rendered_content or f.content)
     
+    # Create breadcrumb navigation links.
+    with phase('breadcrumbs'):
+        breadcrumbs = get_breadcrumbs(f, site_id)
     
     c = RequestContext(request, {
         'flatpage': f,
         'breadcrumbs': breadcrumbs,
     })
-    response = HttpResponse(t.render(c))
-    populate_xheaders(request, response, FlatPage, f.id)
-    return response
-    # TODO: Use render_to_response here...
+    with phase('render'):
+        return t.render(c)
+
+def is_cacheable(request, f):
+    """
+    Whether the rendered page is the same for everyone who can see it, and so
+    can be cached.
+    """
+    return (request.method in ('GET', 'HEAD') and f.status == 'p' and
+            not f.registration_required and 
+            not request.user.is_authenticated())
+
+def flatpage_etag(f):
+    """
+    Return a strong ETag for the rendered page.
+    
+    It changes when the page is modified, when its template changes or
+    ``FLATPAGES_PLUS_TEMPLATE_VERSION`` is bumped, and when any other flatpage
+    changes (which may rename one of the page's breadcrumbs).
+    """
+    parts = [f.pk, f.modified, f.template_name, 
+             app_settings.TEMPLATE_VERSION, get_generation()]
+    return hashlib.md5(':'.join([smart_str(p) for p in parts])).hexdigest()
+
+def not_modified(request, etag):
+    """
+    Check the request's ``If-None-Match`` header to see if the client's copy
+    of the page is still current.
+    
+    There's no ``Last-Modified``: a page's modification time doesn't change
+    when its template or its breadcrumbs do, but its ETag does.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    return False
+
+def set_conditional_headers(response, etag):
+    response['ETag'] = quote_etag(etag)